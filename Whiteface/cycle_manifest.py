@@ -0,0 +1,108 @@
+import os
+import json
+from datetime import datetime
+
+import numpy as np
+
+# ------------------------
+# SETTINGS
+# ------------------------
+script_dir = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_DIR = os.path.join(script_dir, "GFS_shared", "manifests")
+KEEP_MANIFESTS = 8  # most recent cycles kept on disk
+
+
+def field_key(field):
+    return f"{field.variable}:{field.level}"
+
+
+class CycleManifest:
+    """Per-cycle record of which steps/fields were extracted, with their point values.
+
+    A later run for the same cycle only fetches steps that are missing or failed
+    and rebuilds the JSON from the stored values. Fields that a step's file simply
+    does not contain (e.g. PRATE at f000) are recorded as absent so they are not
+    re-requested forever.
+    """
+
+    def __init__(self, date_str, hour_str, stations):
+        self.cycle = f"{date_str}{hour_str}"
+        self.path = os.path.join(MANIFEST_DIR, f"{self.cycle}.json")
+        self.station_ids = [[s.name, s.lat, s.lon] for s in stations]
+        self.data = self._load()
+
+    def _new(self):
+        return {"cycle": self.cycle, "stations": self.station_ids, "steps": {}, "published": False}
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return self._new()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"[WARN] Ignoring unreadable manifest {self.path}: {e}")
+            return self._new()
+        if data.get("stations") != self.station_ids:
+            print("[WARN] Station registry changed since the last run → re-extracting the cycle.")
+            return self._new()
+        return data
+
+    def done_steps(self, fields):
+        """Steps whose every field has a stored value or is known to be absent."""
+        keys = {field_key(f) for f in fields}
+        done = set()
+        for step, entry in self.data["steps"].items():
+            if keys <= set(entry["values"]) | set(entry["absent"]):
+                done.add(int(step))
+        return done
+
+    def record(self, step, fields, step_values):
+        """Store one step's extracted values ({field: array per station})."""
+        entry = self.data["steps"].setdefault(str(step), {"values": {}, "absent": []})
+        for field in fields:
+            key = field_key(field)
+            if field in step_values:
+                entry["values"][key] = [float(v) for v in step_values[field]]
+                if key in entry["absent"]:
+                    entry["absent"].remove(key)
+            elif key not in entry["absent"]:
+                entry["absent"].append(key)
+        self.data["published"] = False
+
+    def values(self, fields):
+        """Rebuild {field: {step: array per station}} from the stored point values."""
+        out = {field: {} for field in fields}
+        for step, entry in self.data["steps"].items():
+            for field in fields:
+                stored = entry["values"].get(field_key(field))
+                if stored is not None:
+                    out[field][int(step)] = np.asarray(stored)
+        return out
+
+    @property
+    def published(self):
+        return self.data.get("published", False)
+
+    def mark_published(self):
+        self.data["published"] = True
+        self.data["published_at"] = datetime.utcnow().isoformat() + "Z"
+
+    def save(self):
+        os.makedirs(MANIFEST_DIR, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f)
+        os.replace(tmp_path, self.path)
+
+
+def prune_manifests(keep=KEEP_MANIFESTS):
+    """Drop manifests of all but the newest `keep` cycles."""
+    if not os.path.isdir(MANIFEST_DIR):
+        return
+    names = sorted(f for f in os.listdir(MANIFEST_DIR) if f.endswith(".json"))
+    for f in names[:-keep]:
+        try:
+            os.remove(os.path.join(MANIFEST_DIR, f))
+        except Exception:
+            pass
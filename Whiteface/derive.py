@@ -0,0 +1,59 @@
+import numpy as np
+
+# ------------------------
+# SETTINGS
+# ------------------------
+M_TO_IN = 39.3701
+PRECIP_TYPES = np.array(["none", "rain", "snow"])  # index = precip code
+
+
+# ------------------------
+# FUNCTIONS
+# ------------------------
+# All functions take (stations, time) arrays (a 1D series is treated as one
+# station) and work along the time axis for every station at once.
+def _as_2d(values):
+    return np.atleast_2d(np.asarray(values, dtype=float))
+
+
+def depth_inches(depth_m):
+    """Snow depth in metres -> inches, negatives clipped to 0."""
+    return np.maximum(_as_2d(depth_m) * M_TO_IN, 0.0)
+
+
+def positive_increments(series):
+    """Step-to-step increase, clipped at 0; the first step is 0."""
+    arr = _as_2d(series)
+    inc = np.zeros_like(arr)
+    inc[:, 1:] = np.maximum(np.diff(arr, axis=1), 0.0)
+    return inc
+
+
+def running_positive_sum(series):
+    """Running total of increases that resets to 0 on any step without an increase.
+
+    This is the rule both snow products use. The segmented sum walks the time
+    axis once with whole-station vector ops, adding in the same order as the
+    original per-element loops, so results match them bit for bit. A NaN step
+    counts as no increase and resets the total (tests/test_derive.py).
+    """
+    inc = positive_increments(series)
+    out = np.empty_like(inc)
+    total = np.zeros(inc.shape[0])
+    for t in range(inc.shape[1]):
+        total = np.where(inc[:, t] > 0, total + inc[:, t], 0.0)
+        out[:, t] = total
+    return out
+
+
+def precip_codes(prate, csnow):
+    """Index into PRECIP_TYPES: snow where CSNOW > 0, else rain where PRATE > 0, else none."""
+    prate = _as_2d(prate)
+    csnow = _as_2d(csnow)
+    # NaN compares False, so a missing value classifies like the scalar code did (none)
+    return np.where(csnow * 3600 > 0, 2, np.where(prate * 3600 > 0, 1, 0))
+
+
+def precip_types(prate, csnow):
+    """precip_codes as "snow"/"rain"/"none" strings."""
+    return PRECIP_TYPES[precip_codes(prate, csnow)]
@@ -0,0 +1,83 @@
+import os
+from datetime import datetime, timedelta
+
+from gfs_fetch import Downloader, grib_file_name
+from gfs_plan import current_cycle
+
+# ------------------------
+# SETTINGS
+# ------------------------
+# Directory listing that holds the raw GFS files and their .idx inventories
+PROD_URL = os.environ.get("GFS_PROD_URL", "https://nomads.ncep.noaa.gov/pub/data/nccf/com/gfs/prod")
+
+# "complete": newest cycle whose final step is out
+# "stream":   newest cycle with f000 out, limited to the steps published so far
+CYCLE_MODE = os.environ.get("GFS_CYCLE_MODE", "complete")
+LOOKBACK_CYCLES = 4
+
+
+def idx_url(date_str, hour_str, step):
+    return f"{PROD_URL}/gfs.{date_str}/{hour_str}/atmos/{grib_file_name(hour_str, step)}.idx"
+
+
+def recent_cycles(now=None, count=LOOKBACK_CYCLES):
+    """(date_str, hour_str) of the nominal 6-hourly cycles up to now, newest first."""
+    now = now or datetime.utcnow()
+    t = now.replace(hour=now.hour // 6 * 6, minute=0, second=0, microsecond=0)
+    for _ in range(count):
+        yield t.strftime("%Y%m%d"), t.strftime("%H")
+        t -= timedelta(hours=6)
+
+
+class CycleProbe:
+    """Cheap HEAD checks on .idx inventories to see which cycles/steps exist."""
+
+    def __init__(self, downloader):
+        self.downloader = downloader
+        self.reachable = False
+
+    def available(self, date_str, hour_str, step):
+        status = self.downloader.head(idx_url(date_str, hour_str, step))
+        if status is not None:
+            self.reachable = True
+        return status == 200
+
+    def available_prefix(self, date_str, hour_str, steps):
+        """Steps published so far. NCEP writes steps in order, so binary search the prefix."""
+        lo, hi = 0, len(steps)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.available(date_str, hour_str, steps[mid]):
+                lo = mid + 1
+            else:
+                hi = mid
+        return steps[:lo]
+
+
+def select_cycle(steps, mode=None, now=None, downloader=None):
+    """Pick the cycle to process: returns (date_str, hour_str, steps to process).
+
+    Falls back to the fixed "6 hours ago" guess when NOMADS cannot be reached.
+    """
+    mode = mode or CYCLE_MODE
+    own = downloader is None
+    downloader = downloader or Downloader()
+    probe = CycleProbe(downloader)
+    try:
+        for date_str, hour_str in recent_cycles(now):
+            if probe.available(date_str, hour_str, steps[-1]):
+                print(f"GFS {date_str} {hour_str}z is complete.")
+                return date_str, hour_str, list(steps)
+            if mode == "stream" and probe.available(date_str, hour_str, steps[0]):
+                published = probe.available_prefix(date_str, hour_str, steps)
+                print(f"GFS {date_str} {hour_str}z in progress: {len(published)} of {len(steps)} steps out.")
+                return date_str, hour_str, published
+            if not probe.reachable:
+                break
+    finally:
+        if own:
+            downloader.close()
+    date_str, hour_str = current_cycle(now)
+    reason = "no recent cycle found" if probe.reachable else "NOMADS unreachable"
+    print(f"[WARN] {reason} → falling back to GFS {date_str} {hour_str}z.")
+    return date_str, hour_str, list(steps)
@@ -0,0 +1,205 @@
+import os
+import time
+import random
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import DOWNLOAD_REQUESTS, observe
+
+# ------------------------
+# SETTINGS
+# ------------------------
+# Override with a local stand-in (e.g. http://127.0.0.1:8000/cgi-bin/filter_gfs_0p25.pl) for testing
+BASE_URL = os.environ.get("GFS_FILTER_URL", "https://nomads.ncep.noaa.gov/cgi-bin/filter_gfs_0p25.pl")
+
+MAX_WORKERS = int(os.environ.get("GFS_MAX_WORKERS", "8"))
+
+# Requests per second allowed per host (NOMADS blocks clients above ~120 hits/minute)
+HOST_RATE_LIMITS = {
+    "nomads.ncep.noaa.gov": 1.5,
+}
+DEFAULT_RATE_LIMIT = None  # unlimited for hosts not listed above (e.g. a local stand-in)
+
+MAX_RETRIES = 4
+BACKOFF_BASE = 2.0   # seconds, doubled on every retry
+BACKOFF_MAX = 60.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+TIMEOUT = (10, 120)  # (connect, read) seconds
+CHUNK_SIZE = 64 * 1024
+
+
+def grib_file_name(hour_str, step):
+    return f"gfs.t{hour_str}z.pgrb2.0p25.f{step:03d}"
+
+
+def build_filter_url(date_str, hour_str, step, variables, levels, bbox=None):
+    """Build a filter_gfs_0p25.pl URL for one forecast step, e.g. levels=["surface", "975_mb"].
+
+    bbox is an optional (top_lat, bottom_lat, left_lon, right_lon) subregion; without
+    it the filter returns the full global grid.
+    """
+    query = (
+        f"?dir=%2Fgfs.{date_str}%2F{hour_str}%2Fatmos"
+        f"&file={grib_file_name(hour_str, step)}"
+    )
+    query += "".join(f"&var_{v}=on" for v in variables)
+    query += "".join(f"&lev_{lev}=on" for lev in levels)
+    if bbox is not None:
+        top, bottom, left, right = bbox
+        query += f"&subregion=&toplat={top:g}&leftlon={left:g}&rightlon={right:g}&bottomlat={bottom:g}"
+    return BASE_URL + query
+
+
+def is_grib(path):
+    """True if the file starts with a GRIB header (the filter answers errors with small HTML pages)."""
+    with open(path, "rb") as fh:
+        return fh.read(4) == b"GRIB"
+
+
+class RateLimiter:
+    """Spaces request starts so a single host sees at most `rate` requests per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def make_session(pool_size=MAX_WORKERS):
+    """Keep-alive session whose connection pool is large enough for every worker."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Exponential backoff with jitter; honours a numeric Retry-After header."""
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    delay = min(BACKOFF_BASE * (2 ** attempt), BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class Downloader:
+    """Bounded-concurrency GRIB downloader shared by every GFS script.
+
+    All workers share one pooled keep-alive session; each host gets its own rate
+    limiter and failed requests are retried with exponential backoff.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, rate_limits=None, max_retries=MAX_RETRIES,
+                 timeout=TIMEOUT):
+        self.max_workers = max_workers
+        self.rate_limits = HOST_RATE_LIMITS if rate_limits is None else rate_limits
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = make_session(max_workers)
+        self._limiters = {}
+        self._limiters_lock = threading.Lock()
+
+    def _limiter(self, url):
+        host = urlsplit(url).hostname
+        with self._limiters_lock:
+            if host not in self._limiters:
+                self._limiters[host] = RateLimiter(self.rate_limits.get(host, DEFAULT_RATE_LIMIT))
+            return self._limiters[host]
+
+    def fetch(self, url, file_path, key=None):
+        """Download url to file_path. Returns the path, or None if the file is unavailable.
+
+        Time to response headers (http_wait) and body transfer (download) are
+        recorded per attempt; key (the forecast step) labels them per step.
+        """
+        name = os.path.basename(file_path)
+        part_path = file_path + ".part"
+        reason = ""
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            self._limiter(url).wait()
+            t0 = time.perf_counter()
+            try:
+                with self.session.get(url, stream=True, timeout=self.timeout) as r:
+                    t1 = time.perf_counter()
+                    observe("http_wait", t1 - t0, key)
+                    if r.status_code == 200:
+                        nbytes = 0
+                        with open(part_path, "wb") as fh:
+                            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                                if chunk:
+                                    fh.write(chunk)
+                                    nbytes += len(chunk)
+                        observe("download", time.perf_counter() - t1, key, nbytes)
+                        DOWNLOAD_REQUESTS.inc(status=200)
+                        if not is_grib(part_path):
+                            print(f"[WARN] {name} is not a GRIB file → removing.")
+                            os.remove(part_path)
+                            return None
+                        os.replace(part_path, file_path)
+                        return file_path
+                    DOWNLOAD_REQUESTS.inc(status=r.status_code)
+                    if r.status_code not in RETRY_STATUS:
+                        print(f"[ERROR] Failed to download {name} (status {r.status_code})")
+                        return None
+                    reason = f"status {r.status_code}"
+                    retry_after = r.headers.get("Retry-After")
+            except requests.RequestException as e:
+                DOWNLOAD_REQUESTS.inc(status="error")
+                reason = str(e)
+            if attempt < self.max_retries:
+                delay = backoff_delay(attempt, retry_after)
+                print(f"[WARN] {name}: {reason}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                # shows up as time spent waiting on NOMADS rather than a stalled run
+                observe("backoff", delay, key)
+                time.sleep(delay)
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        print(f"[ERROR] Failed to download {name} after {self.max_retries + 1} attempts ({reason})")
+        return None
+
+    def head(self, url):
+        """Status code of a rate-limited HEAD request, or None if the host could not be reached."""
+        self._limiter(url).wait()
+        try:
+            r = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+            return r.status_code
+        except requests.RequestException as e:
+            print(f"[WARN] HEAD {url} failed: {e}")
+            return None
+
+    def fetch_iter(self, jobs):
+        """Download (key, url, file_path) jobs concurrently, yielding (key, path or None) as each finishes."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self.fetch, url, path, key): key for key, url, path in jobs}
+            for fut in as_completed(futures):
+                key = futures[fut]
+                try:
+                    yield key, fut.result()
+                except Exception as e:
+                    print(f"[ERROR] Download for {key} raised: {e}")
+                    yield key, None
+
+    def fetch_all(self, jobs):
+        """Download (key, url, file_path) jobs concurrently. Returns {key: path or None}."""
+        return dict(self.fetch_iter(jobs))
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,223 @@
+import os
+import time
+import shutil
+import multiprocessing
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from derive import depth_inches, precip_codes
+from gfs_plan import TMP_975, SNOD_SFC, PRATE_SFC, CSNOW_SFC
+from grib_cache import GRIB_CACHE
+from grib_points import read_grids
+from publish import JSON_DIR, write_json_atomic
+
+# ------------------------
+# SETTINGS
+# ------------------------
+MAP_DIR = os.path.join(JSON_DIR, "maps")
+# (top, bottom, left, right) of the rendered region: the Adirondacks by default
+MAP_BBOX = tuple(float(v) for v in os.environ.get("GFS_MAP_BBOX", "45.0,43.0,-75.5,-73.25").split(","))
+MAP_WORKERS = int(os.environ.get("GFS_MAP_WORKERS", os.cpu_count() or 2))
+MAP_DPI = 100
+KEEP_MAP_CYCLES = 4
+MAP_FIELDS = [TMP_975, SNOD_SFC, PRATE_SFC, CSNOW_SFC]
+
+# one panel per derived field: (key, title, units, colormap, vmin, vmax)
+PANELS = [
+    ("temp_f", "975 mb temperature", "°F", "coolwarm", -10, 50),
+    ("snow_depth_in", "Snow depth", "in", "Blues", 0, 60),
+    ("precip_rate_in_hr", "Precip rate", "in/hr", "viridis", 0, 0.5),
+    ("precip_type", "Precip type", "", ["#f0f0f0", "#4daf4a", "#377eb8"], -0.5, 2.5),
+]
+
+
+# ------------------------
+# DECODE (main process)
+# ------------------------
+def region_points(bbox=MAP_BBOX):
+    """Corners of the map region, so the step-file subregion can be widened to cover it."""
+    top, bottom, left, right = bbox
+    return [(top, left), (bottom, right)]
+
+
+def _crop(lats, lons, bbox):
+    """Row/column selectors of the grid inside bbox (lons normalised to -180..180)."""
+    top, bottom, left, right = bbox
+    lons = np.where(lons > 180, lons - 360, lons)
+    rows = np.where((lats >= bottom) & (lats <= top))[0]
+    cols = np.where((lons >= left) & (lons <= right))[0]
+    return rows, cols, lats[rows], lons[cols]
+
+
+def decode_frame(files, bbox=MAP_BBOX):
+    """Decode one step's cached fields ({field: path}) once and derive every panel over the map region.
+
+    Returns (lats, lons, {panel key: 2D float32 array}) or None if none of
+    the map fields could be decoded.
+    """
+    grids = {}
+    for field, path in files.items():
+        grids.update(read_grids(path, [field]))
+    if not grids:
+        return None
+    lats, lons, _ = next(iter(grids.values()))
+    rows, cols, lats, lons = _crop(lats, lons, bbox)
+    shape = (rows.size, cols.size)
+
+    def field(f):
+        if f not in grids:
+            return np.full(shape, np.nan)
+        return grids[f][2][np.ix_(rows, cols)]
+
+    tmp, sde, prate, csnow = (field(f) for f in MAP_FIELDS)
+    precip = precip_codes(prate, np.nan_to_num(csnow)).astype(float)
+    precip[np.isnan(prate)] = np.nan
+    panels = {
+        "temp_f": (tmp - 273.15) * 9.0 / 5.0 + 32.0,
+        "snow_depth_in": depth_inches(sde),
+        "precip_rate_in_hr": prate * 3600 / 25.4,  # kg m-2 s-1 = mm/s
+        "precip_type": precip,
+    }
+    return lats, lons, {key: arr.astype(np.float32) for key, arr in panels.items()}
+
+
+# ------------------------
+# RENDER (worker processes)
+# ------------------------
+_CANVAS = None
+
+
+class _Canvas:
+    """One figure per worker process, built once and re-used for every frame.
+
+    Projection, Natural Earth features, axes, colorbars and the meshes are set
+    up on the first frame; each frame then only swaps the mesh data and title
+    and saves, which is where most of a naive per-frame render goes.
+    """
+
+    def __init__(self, lats, lons, bbox):
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import ListedColormap
+        import cartopy.crs as ccrs
+        import cartopy.feature as cfeature
+
+        top, bottom, left, right = bbox
+        data_crs = ccrs.PlateCarree()
+        proj = ccrs.LambertConformal(central_longitude=(left + right) / 2, central_latitude=(top + bottom) / 2)
+        features = []
+        for feature in (cfeature.STATES.with_scale("10m"), cfeature.LAKES.with_scale("10m")):
+            try:
+                # force the (possibly downloaded) shapefile now rather than at the first savefig
+                next(iter(feature.geometries()), None)
+                features.append(feature)
+            except Exception as e:
+                print(f"[WARN] Map feature unavailable, drawing without it: {e}")
+
+        self.fig, axes = plt.subplots(2, 2, figsize=(11, 9), subplot_kw={"projection": proj})
+        self.meshes = {}
+        empty = np.full((lats.size, lons.size), np.nan)
+        for ax, (key, title, units, cmap, vmin, vmax) in zip(axes.flat, PANELS):
+            ax.set_extent([left, right, bottom, top], crs=data_crs)
+            categorical = isinstance(cmap, list)
+            if categorical:
+                cmap = ListedColormap(cmap)
+            mesh = ax.pcolormesh(lons, lats, empty, transform=data_crs, cmap=cmap,
+                                 vmin=vmin, vmax=vmax, shading="nearest")
+            for feature in features:
+                ax.add_feature(feature, facecolor="none", edgecolor="0.3", linewidth=0.6)
+            cbar = self.fig.colorbar(mesh, ax=ax, shrink=0.8, label=units)
+            if categorical:
+                cbar.set_ticks(range(cmap.N))
+                cbar.set_ticklabels(["none", "rain", "snow"])
+            ax.set_title(title)
+            self.meshes[key] = mesh
+        self.suptitle = self.fig.suptitle("")
+
+    def draw(self, title, panels, path):
+        for key, mesh in self.meshes.items():
+            mesh.set_array(panels[key].ravel())
+        self.suptitle.set_text(title)
+        tmp_path = f"{path}.{os.getpid()}.tmp.png"
+        self.fig.savefig(tmp_path, dpi=MAP_DPI)
+        os.replace(tmp_path, path)
+        return path
+
+
+def _init_worker(lats, lons, bbox):
+    global _CANVAS
+    _CANVAS = _Canvas(lats, lons, bbox)
+
+
+def _render_frame(job):
+    title, panels, path = job
+    return _CANVAS.draw(title, panels, path)
+
+
+# ------------------------
+# CYCLE
+# ------------------------
+def render_cycle(date_str, hour_str, steps, bbox=None, region=MAP_BBOX, workers=MAP_WORKERS):
+    """Render one 4-panel PNG per available step of a cycle into MAP_DIR/<cycle>/.
+
+    Each step's cached fields are decoded once here; the small regional arrays are handed
+    to a pool of worker processes that each keep a ready-made figure.
+    Returns the list of written PNG paths.
+    """
+    cycle = f"{date_str}{hour_str}"
+    base = datetime.strptime(cycle, "%Y%m%d%H")
+    out_dir = os.path.join(MAP_DIR, cycle)
+    os.makedirs(out_dir, exist_ok=True)
+
+    t0 = time.monotonic()
+    grid = None
+    jobs = []
+    frames = []
+    for step in steps:
+        files = GRIB_CACHE.lookup(cycle, step, MAP_FIELDS, bbox)
+        if not files:
+            continue
+        decoded = decode_frame(files, region)
+        if decoded is None:
+            continue
+        lats, lons, panels = decoded
+        if grid is None:
+            grid = (lats, lons)
+        elif lats.shape != grid[0].shape or lons.shape != grid[1].shape:
+            print(f"[WARN] f{step:03d} is on a different grid; skipped.")
+            continue
+        valid = (base + timedelta(hours=step)).strftime("%a %d %b %HZ")
+        title = f"GFS {date_str} {hour_str}z  f{step:03d}  valid {valid}"
+        png = os.path.join(out_dir, f"f{step:03d}.png")
+        jobs.append((title, panels, png))
+        frames.append({"step": step, "file": f"{cycle}/f{step:03d}.png"})
+    t1 = time.monotonic()
+    if not jobs:
+        print("No step files available to render maps.")
+        return []
+
+    ctx = multiprocessing.get_context("spawn")  # no fork of a threaded web worker
+    workers = max(1, min(workers, len(jobs)))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(grid[0], grid[1], region)) as pool:
+        written = list(pool.map(_render_frame, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    t2 = time.monotonic()
+
+    write_json_atomic(os.path.join(MAP_DIR, "index.json"),
+                      {"cycle": cycle, "bbox": list(region), "frames": frames}, indent=2)
+    print(f"Rendered {len(written)} map frames: decode {t1 - t0:.1f}s, render {t2 - t1:.1f}s ({workers} workers)")
+    prune_map_cycles(keep_cycle=cycle)
+    return written
+
+
+def prune_map_cycles(keep=KEEP_MAP_CYCLES, keep_cycle=None):
+    """Drop all but the newest `keep` cycles of rendered maps."""
+    if not os.path.isdir(MAP_DIR):
+        return
+    cycles = sorted(d for d in os.listdir(MAP_DIR) if d.isdigit())
+    for cycle in cycles[:-keep]:
+        if cycle != keep_cycle:
+            shutil.rmtree(os.path.join(MAP_DIR, cycle), ignore_errors=True)
@@ -0,0 +1,126 @@
+import os
+import math
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import xarray as xr
+
+# ------------------------
+# SETTINGS
+# ------------------------
+script_dir = os.path.dirname(os.path.abspath(__file__))
+SHARED_DIR = os.path.join(script_dir, "GFS_shared")
+
+# Degrees of padding around the points of interest when requesting a subregion;
+# set GFS_BBOX_PAD_DEG=global to fall back to full global grids.
+BBOX_PAD = os.environ.get("GFS_BBOX_PAD_DEG", "1.0")
+GRID_RES = 0.25
+
+# Forecast step schedule as "until:every" segments (hours), each starting where
+# the previous one ended. GFS publishes hourly files through f120, 3-hourly to
+# f240 and 12-hourly after that; "384:6" gives the old 6-hourly series.
+STEP_SCHEDULE = os.environ.get("GFS_STEP_SCHEDULE", "120:1,240:3,384:12")
+MAX_STEP = 384
+
+# One GRIB field as named by the NOMADS filter (var_<variable>, lev_<level>)
+Field = namedtuple("Field", ["variable", "level"])
+
+TMP_975 = Field("TMP", "975_mb")
+SNOD_SFC = Field("SNOD", "surface")
+PRATE_SFC = Field("PRATE", "surface")
+CSNOW_SFC = Field("CSNOW", "surface")
+
+# GRIB keys that pick each field back out of a merged file
+# (used both as cfgrib filter_by_keys and for direct eccodes matching)
+GRIB_KEYS = {
+    TMP_975: {"shortName": "t", "typeOfLevel": "isobaricInhPa", "level": 975},
+    SNOD_SFC: {"shortName": "sde", "typeOfLevel": "surface", "stepType": "instant"},
+    PRATE_SFC: {"shortName": "prate", "typeOfLevel": "surface", "stepType": "instant"},
+    CSNOW_SFC: {"shortName": "csnow", "typeOfLevel": "surface", "stepType": "instant"},
+}
+
+# Fields that are never interpolated: precip type is categorical and has always
+# been classified from the nearest grid point
+NEAREST_ONLY = {PRATE_SFC, CSNOW_SFC}
+
+# Fields each product needs from every forecast step
+PRODUCT_FIELDS = {
+    "temp_975": [TMP_975],
+    "snow_rate": [SNOD_SFC],
+    "snow_acc": [SNOD_SFC],
+    "precip_type": [PRATE_SFC, CSNOW_SFC],
+}
+
+
+# ------------------------
+# PLANNING
+# ------------------------
+def parse_step_schedule(spec=None):
+    """Expand a schedule like "120:1,240:3,384:12" into forecast steps [0, 1, ..., 120, 123, ...]."""
+    steps = []
+    for segment in (spec or STEP_SCHEDULE).split(","):
+        try:
+            until, every = (int(v) for v in segment.split(":"))
+        except ValueError:
+            raise ValueError(f"Bad step schedule segment {segment!r}; expected until:every") from None
+        first = steps[-1] + every if steps else 0
+        if every <= 0 or until < first or until > MAX_STEP:
+            raise ValueError(f"Bad step schedule segment {segment!r}")
+        steps.extend(range(first, until + 1, every))
+    return steps
+
+
+def current_cycle(now=None):
+    """(DATE_STR, HOUR_STR) of the last 6-hourly cycle, offset 6 h to allow for publication."""
+    current_utc_time = (now or datetime.utcnow()) - timedelta(hours=6)
+    date_str = current_utc_time.strftime("%Y%m%d")
+    hour_str = str(current_utc_time.hour // 6 * 6).zfill(2)
+    return date_str, hour_str
+
+
+def product_fields(products=None):
+    """Every field the products (default all) need, sorted."""
+    products = list(PRODUCT_FIELDS) if products is None else products
+    return sorted({f for p in products for f in PRODUCT_FIELDS[p]})
+
+
+def fields_request(fields):
+    """Merge fields into one (variables, levels) filter request."""
+    variables = sorted({f.variable for f in fields})
+    levels = sorted({f.level for f in fields})
+    return variables, levels
+
+
+def plan_fields(products=None):
+    """Merge the fields every product needs into one (variables, levels) filter request."""
+    return fields_request(product_fields(products))
+
+
+def bbox_around(points, pad=None):
+    """Smallest 0.25°-aligned (top, bottom, left, right) box covering every (lat, lon) plus padding.
+
+    Returns None (global grid) when padding is configured as "global".
+    """
+    pad = BBOX_PAD if pad is None else pad
+    if str(pad).lower() == "global":
+        return None
+    pad = float(pad)
+    lats = [lat for lat, _ in points]
+    lons = [lon for _, lon in points]
+    top = math.ceil((max(lats) + pad) / GRID_RES) * GRID_RES
+    bottom = math.floor((min(lats) - pad) / GRID_RES) * GRID_RES
+    left = math.floor((min(lons) - pad) / GRID_RES) * GRID_RES
+    right = math.ceil((max(lons) + pad) / GRID_RES) * GRID_RES
+    return min(top, 90.0), max(bottom, -90.0), left, right
+
+
+# ------------------------
+# FAN-OUT
+# ------------------------
+def open_field(path, field):
+    """Open a single field from a GRIB file as an xarray Dataset."""
+    return xr.open_dataset(
+        path, engine="cfgrib",
+        filter_by_keys=GRIB_KEYS[field],
+        indexpath="",  # no .idx sidecar: several products may read the same file
+    )
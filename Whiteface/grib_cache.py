@@ -0,0 +1,195 @@
+import os
+import time
+import hashlib
+
+from gfs_fetch import Downloader, build_filter_url
+from gfs_plan import SHARED_DIR, fields_request, product_fields
+from grib_points import split_fields
+from metrics import GRIB_CACHE_BYTES, GRIB_CACHE_FIELDS
+
+# ------------------------
+# SETTINGS
+# ------------------------
+CACHE_DIR = os.environ.get("GFS_GRIB_CACHE_DIR", os.path.join(SHARED_DIR, "grib_cache"))
+# Evict least recently used fields above this size...
+CACHE_MAX_BYTES = int(float(os.environ.get("GFS_GRIB_CACHE_MAX_MB", 2048)) * 1024 * 1024)
+# ...and any field unused for this long (a few cycles: retries and late steps of the previous one)
+CACHE_MAX_AGE_SECONDS = float(os.environ.get("GFS_GRIB_CACHE_MAX_AGE_HOURS", 24)) * 3600
+# Merged step downloads land here before they are split into fields; older leftovers were cut short
+INCOMING_DIR = "incoming"
+STALE_INCOMING_SECONDS = 3600
+
+
+def entry_key(cycle, step, field, bbox=None):
+    """Canonical key of one cached field, e.g. 2026011606/f012/SNOD/surface/45,42,-76,-73."""
+    region = "global" if bbox is None else ",".join(f"{v:g}" for v in bbox)
+    return f"{cycle}/f{step:03d}/{field.variable}/{field.level}/{region}"
+
+
+class GribCache:
+    """Shared on-disk store of GRIB fields, one message per (cycle, step, variable, level, bbox).
+
+    Entries are addressed by the SHA-1 of their key, so every product, run and
+    process needing a field finds the same file whatever was fetched with it;
+    a run only downloads the fields no earlier run (or crashed attempt) left
+    behind. Each use refreshes an entry's mtime, and evict() drops entries
+    unused for max_age, then the least recently used until the cache fits
+    max_bytes.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE_SECONDS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def path_for(self, cycle, step, field, bbox=None):
+        digest = hashlib.sha1(entry_key(cycle, step, field, bbox).encode()).hexdigest()
+        return os.path.join(self.root, digest[:2], digest + ".grib2")
+
+    def lookup(self, cycle, step, fields, bbox=None):
+        """{field: path} of the fields already cached for a step; each hit counts as a use."""
+        found = {}
+        for field in fields:
+            path = self.path_for(cycle, step, field, bbox)
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                continue
+            found[field] = path
+        return found
+
+    def store(self, cycle, step, fields, bbox, grib_path):
+        """Split a downloaded step file into one entry per field; returns {field: path} of those it held."""
+        stored = {}
+        for field, message in split_fields(grib_path, fields).items():
+            path = self.path_for(cycle, step, field, bbox)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as fh:
+                fh.write(message)
+            os.replace(tmp_path, path)
+            stored[field] = path
+        return stored
+
+    # ---- fetching ----
+    def iter_cycle(self, date_str, hour_str, steps, products=None, bbox=None, downloader=None):
+        """Yield (step, {field: path}) covering every field the products need, as each step becomes ready.
+
+        Fully cached steps come first. For the rest one merged filter request
+        per step asks for just the missing fields; these go out concurrently in
+        step order and are yielded in completion order. A step whose download
+        or caching failed yields (step, None), even if some of its fields were
+        cached, so it is neither extracted nor recorded as done. A field left
+        out of a step's dict was missing from a file that did download.
+        """
+        cycle = f"{date_str}{hour_str}"
+        fields = product_fields(products)
+        incoming = os.path.join(self.root, INCOMING_DIR)
+        os.makedirs(incoming, exist_ok=True)
+        jobs = []
+        pending = {}
+        for step in steps:
+            cached = self.lookup(cycle, step, fields, bbox)
+            missing = [f for f in fields if f not in cached]
+            GRIB_CACHE_FIELDS.inc(len(cached), result="hit")
+            GRIB_CACHE_FIELDS.inc(len(missing), result="miss")
+            if not missing:
+                yield step, cached
+                continue
+            variables, levels = fields_request(missing)
+            url = build_filter_url(date_str, hour_str, step, variables, levels, bbox)
+            jobs.append((step, url, os.path.join(incoming, f"{cycle}_f{step:03d}.{os.getpid()}.grib2")))
+            pending[step] = (cached, missing)
+        region = "global" if bbox is None else "bbox " + ",".join(f"{v:g}" for v in bbox)
+        missing_count = sum(len(m) for _, m in pending.values())
+        print(f"Fetching {missing_count} fields in {len(jobs)} step files ({region}), "
+              f"reusing {len(steps) * len(fields) - missing_count} cached.")
+        if not jobs:
+            return
+        own = downloader is None
+        downloader = downloader or Downloader()
+        try:
+            for step, path in downloader.fetch_iter(jobs):
+                cached, missing = pending[step]
+                if not path:
+                    yield step, None
+                    continue
+                try:
+                    cached.update(self.store(cycle, step, missing, bbox, path))
+                except Exception as e:
+                    print(f"[ERROR] Caching f{step:03d}: {e}")
+                    cached = None
+                finally:
+                    os.remove(path)
+                yield step, cached
+        finally:
+            if own:
+                downloader.close()
+
+    def fetch_cycle(self, date_str, hour_str, steps, products=None, bbox=None, downloader=None):
+        """Every field the products need for each step, fetching what is not cached: {step: {field: path} or None}."""
+        return dict(self.iter_cycle(date_str, hour_str, steps, products, bbox, downloader))
+
+    # ---- eviction ----
+    def _entries(self):
+        """(mtime, size, path) of every cached field."""
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for bucket in os.scandir(self.root):
+            if not bucket.is_dir() or bucket.name == INCOMING_DIR:
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith(".grib2"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _remove_stale_incoming(self, now):
+        incoming = os.path.join(self.root, INCOMING_DIR)
+        if not os.path.isdir(incoming):
+            return
+        for entry in os.scandir(incoming):
+            if now - entry.stat().st_mtime > STALE_INCOMING_SECONDS:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def evict(self, keep_since=None):
+        """Drop fields unused for max_age, then the least recently used until the cache fits max_bytes.
+
+        Fields used at or after keep_since (the run in progress) are always
+        kept. Returns (fields removed, bytes removed).
+        """
+        now = time.time()
+        self._remove_stale_incoming(now)
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = freed = 0
+        for mtime, size, path in entries:
+            expired = now - mtime > self.max_age
+            if not expired and total <= self.max_bytes:
+                break
+            if keep_since is not None and mtime >= keep_since:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[WARN] Could not evict {path}: {e}")
+                continue
+            total -= size
+            removed += 1
+            freed += size
+        if total > self.max_bytes:
+            print(f"[WARN] GRIB cache holds {total / 1e6:.1f} MB used by this run, "
+                  f"above its {self.max_bytes / 1e6:.0f} MB cap.")
+        GRIB_CACHE_BYTES.set(total)
+        print(f"GRIB cache: evicted {removed} fields ({freed / 1e6:.1f} MB), "
+              f"{len(entries) - removed} kept ({total / 1e6:.1f} MB).")
+        return removed, freed
+
+
+GRIB_CACHE = GribCache()
@@ -0,0 +1,181 @@
+import time
+
+import numpy as np
+import eccodes
+
+from gfs_plan import GRIB_KEYS, NEAREST_ONLY, open_field
+from grid_index import GRID_INDEX, gather
+from metrics import observe
+
+# Grids whose points we can index straight from the message header; anything
+# else (reduced, rotated, Lambert, ...) goes through the cfgrib/xarray path.
+SUPPORTED_GRIDS = {"regular_ll"}
+
+
+def _grid_axes(gid):
+    """1D latitude/longitude axes of a regular_ll message, in message scanning order."""
+    ni = eccodes.codes_get(gid, "Ni")
+    nj = eccodes.codes_get(gid, "Nj")
+    lat1 = eccodes.codes_get(gid, "latitudeOfFirstGridPointInDegrees")
+    lon1 = eccodes.codes_get(gid, "longitudeOfFirstGridPointInDegrees")
+    di = eccodes.codes_get(gid, "iDirectionIncrementInDegrees")
+    dj = eccodes.codes_get(gid, "jDirectionIncrementInDegrees")
+    j_sign = 1 if eccodes.codes_get(gid, "jScansPositively") else -1
+    i_sign = -1 if eccodes.codes_get(gid, "iScansNegatively") else 1
+    lats = lat1 + j_sign * dj * np.arange(nj)
+    lons = lon1 + i_sign * di * np.arange(ni)
+    return lats, lons
+
+
+def _matches(gid, keys):
+    for key, want in keys.items():
+        try:
+            if eccodes.codes_get(gid, key) != want:
+                return False
+        except eccodes.KeyValueNotFoundError:
+            return False
+    return True
+
+
+def _iter_matching(path, fields):
+    """Yield (field, gid) for the first message in the file matching each field.
+
+    Stops once every field is found. The handle is released when the caller
+    moves on, so it must not be kept past its iteration.
+    """
+    wanted = {field: GRIB_KEYS[field] for field in fields}
+    found = set()
+    with open(path, "rb") as f:
+        while len(found) < len(wanted):
+            gid = eccodes.codes_grib_new_from_file(f)
+            if gid is None:
+                break
+            try:
+                field = next((fld for fld, keys in wanted.items()
+                              if fld not in found and _matches(gid, keys)), None)
+                if field is not None:
+                    found.add(field)
+                    yield field, gid
+            finally:
+                eccodes.codes_release(gid)
+
+
+def _is_regular(gid):
+    return (eccodes.codes_get(gid, "gridType") in SUPPORTED_GRIDS
+            and not eccodes.codes_get(gid, "jPointsAreConsecutive"))
+
+
+def read_points(path, fields, points, method=None, timings=None):
+    """Read fields at (lat, lon) points straight from GRIB messages.
+
+    Only the matching messages are decoded and only the values at the cached
+    grid indices are pulled out, in one gather for all points. Returns
+    {field: array of values ordered like points}; a field on a grid we cannot
+    index maps to None, and a field missing from the file is left out.
+
+    timings, if given, accumulates seconds spent on "decode" (reading and
+    unpacking messages) and "extract" (locating and weighting the points).
+    """
+    t_start = time.perf_counter()
+    extract_s = 0.0
+    results = {}
+    for field, gid in _iter_matching(path, fields):
+        if not _is_regular(gid):
+            results[field] = None
+            continue
+        lats, lons = _grid_axes(gid)
+        t0 = time.perf_counter()
+        rows, cols, w = GRID_INDEX.gather_plan(lats, lons, points, method)
+        flat = rows * lons.size + cols
+        wanted_idx, inverse = np.unique(flat, return_inverse=True)
+        extract_s += time.perf_counter() - t0
+        raw = np.asarray(eccodes.codes_get_double_elements(gid, "values", wanted_idx.tolist()))
+        if eccodes.codes_get(gid, "bitmapPresent"):
+            raw[raw == eccodes.codes_get(gid, "missingValue")] = np.nan
+        t0 = time.perf_counter()
+        results[field] = (raw[inverse].reshape(flat.shape) * w).sum(axis=1)
+        extract_s += time.perf_counter() - t0
+    if timings is not None:
+        timings["decode"] += time.perf_counter() - t_start - extract_s
+        timings["extract"] += extract_s
+    return results
+
+
+def read_grids(path, fields):
+    """Decode whole fields from one file: {field: (lats, lons, 2D values)}.
+
+    Only regular_ll messages are decoded (the GFS 0.25° grid); other grids and
+    fields missing from the file are left out. Missing points come back as NaN.
+    """
+    t_start = time.perf_counter()
+    results = {}
+    for field, gid in _iter_matching(path, fields):
+        if not _is_regular(gid):
+            print(f"[WARN] {field.variable} in {path} is not on a regular lat/lon grid; skipped.")
+            continue
+        lats, lons = _grid_axes(gid)
+        values = np.asarray(eccodes.codes_get_values(gid), dtype=float).reshape(lats.size, lons.size)
+        if eccodes.codes_get(gid, "bitmapPresent"):
+            values[values == eccodes.codes_get(gid, "missingValue")] = np.nan
+        results[field] = (lats, lons, values)
+    observe("decode", time.perf_counter() - t_start)
+    return results
+
+
+def split_fields(path, fields):
+    """The raw GRIB message of each field found in a file: {field: bytes}.
+
+    As in read_points, the first matching message wins; fields missing from the
+    file are left out.
+    """
+    return {field: eccodes.codes_get_message(gid) for field, gid in _iter_matching(path, fields)}
+
+
+def _read_points_xarray(path, field, points, method=None, timings=None):
+    """cfgrib/xarray fallback for grids read_points cannot index directly."""
+    t0 = time.perf_counter()
+    ds = open_field(path, field)
+    try:
+        name = next(iter(ds.data_vars))
+        arr = np.squeeze(ds[name].values)
+        # handle e.g. (time, lat, lon) or (level, lat, lon) after squeeze
+        if arr.ndim >= 3:
+            arr = arr[0]
+        lats = ds['latitude'].values
+        lons = ds['longitude'].values
+        t1 = time.perf_counter()
+        values = gather(arr, lats, lons, points, method)
+    finally:
+        ds.close()
+    if timings is not None:
+        timings["decode"] += t1 - t0
+        timings["extract"] += time.perf_counter() - t1
+    return values
+
+
+def extract_points(files, fields, points):
+    """Every field at every point from one step's files: {field: array of values per point}.
+
+    files maps each field to the GRIB file holding it (see grib_cache). Uses the
+    direct eccodes reader, falling back to xarray per field; fields with no file,
+    or missing from theirs, are left out.
+    """
+    results = {}
+    timings = {"decode": 0.0, "extract": 0.0}
+    by_path = {}
+    for field in fields:
+        if field in files:
+            by_path.setdefault(files[field], []).append(field)
+    for path, path_fields in by_path.items():
+        nearest = [f for f in path_fields if f in NEAREST_ONLY]
+        other = [f for f in path_fields if f not in NEAREST_ONLY]
+        for group, method in ((nearest, "nearest"), (other, None)):
+            if group:
+                results.update(read_points(path, group, points, method, timings))
+    for field, values in list(results.items()):
+        if values is None:
+            method = "nearest" if field in NEAREST_ONLY else None
+            results[field] = _read_points_xarray(files[field], field, points, method, timings)
+    for stage, seconds in timings.items():
+        observe(stage, seconds)
+    return results
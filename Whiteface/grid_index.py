@@ -0,0 +1,146 @@
+import os
+import json
+import threading
+
+import numpy as np
+
+# ------------------------
+# SETTINGS
+# ------------------------
+script_dir = os.path.dirname(os.path.abspath(__file__))
+CACHE_PATH = os.path.join(script_dir, "GFS_shared", "grid_index.json")
+
+# "nearest" (default, matches the original scripts) or "bilinear"
+POINT_METHOD = os.environ.get("GFS_POINT_METHOD", "nearest")
+
+
+def grid_key(lats, lons):
+    """Identify a grid by its shape, first point and increments."""
+    lats = np.asarray(lats)
+    lons = np.asarray(lons)
+    if lats.ndim == 1 and lons.ndim == 1:
+        dlat = lats[1] - lats[0] if lats.size > 1 else 0.0
+        dlon = lons[1] - lons[0] if lons.size > 1 else 0.0
+    elif lats.ndim == 2 and lons.ndim == 2:
+        dlat = lats[1, 0] - lats[0, 0] if lats.shape[0] > 1 else 0.0
+        dlon = lons[0, 1] - lons[0, 0] if lons.shape[1] > 1 else 0.0
+    else:
+        raise ValueError("Unexpected lat/lon array dimensions.")
+    first = (round(float(lats.flat[0]), 6), round(float(lons.flat[0]), 6))
+    return (lats.shape, lons.shape, first, (round(float(dlat), 6), round(float(dlon), 6)))
+
+
+def _bracket(axis, x):
+    """Indices (k0, k1) around x on a monotonic 1D axis and the fractional distance from k0."""
+    n = axis.size
+    if n == 1:
+        return 0, 0, 0.0
+    ascending = axis[-1] >= axis[0]
+    a = axis if ascending else axis[::-1]
+    k = int(np.clip(np.searchsorted(a, x), 1, n - 1))
+    frac = float(np.clip((x - a[k - 1]) / (a[k] - a[k - 1]), 0.0, 1.0))
+    k0, k1 = k - 1, k
+    if not ascending:
+        k0, k1 = n - 1 - k0, n - 1 - k1
+    return k0, k1, frac
+
+
+class GridIndex:
+    """Resolves stations to grid indices once per grid definition and reuses them.
+
+    Entries are kept in memory and mirrored to a small JSON file so later runs
+    (and the other products) skip the search entirely.
+    """
+
+    def __init__(self, cache_path=CACHE_PATH):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        self._plans = {}
+
+    def _load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            print(f"[WARN] Could not save grid index cache: {e}")
+
+    def weights(self, lats, lons, lat, lon, method=None):
+        """Return [((i, j), weight), ...] for a station on the grid described by lats/lons."""
+        method = method or POINT_METHOD
+        entry_key = repr((grid_key(lats, lons), round(lat, 6), round(lon, 6), method))
+        with self._lock:
+            entry = self._entries.get(entry_key)
+        if entry is None:
+            entry = self._resolve(np.asarray(lats), np.asarray(lons), lat, lon, method)
+            with self._lock:
+                self._entries[entry_key] = entry
+                self._save()
+        return [((int(i), int(j)), float(w)) for (i, j), w in entry]
+
+    def gather_plan(self, lats, lons, points, method=None):
+        """(rows, cols, weights) arrays of shape (n_points, k) for gathering many stations at once."""
+        plan_key = (grid_key(lats, lons), tuple(points), method or POINT_METHOD)
+        plan = self._plans.get(plan_key)
+        if plan is None:
+            per_point = [self.weights(lats, lons, lat, lon, method) for lat, lon in points]
+            k = max(len(pw) for pw in per_point)
+            rows = np.zeros((len(points), k), dtype=np.intp)
+            cols = np.zeros((len(points), k), dtype=np.intp)
+            w = np.zeros((len(points), k))
+            for p, pw in enumerate(per_point):
+                # pad short rows with their first index at zero weight
+                pw = pw + [(pw[0][0], 0.0)] * (k - len(pw))
+                for n, ((i, j), wt) in enumerate(pw):
+                    rows[p, n], cols[p, n], w[p, n] = i, j, wt
+            plan = (rows, cols, w)
+            with self._lock:
+                self._plans[plan_key] = plan
+        return plan
+
+    def _resolve(self, lats, lons, lat, lon, method):
+        if method == "bilinear" and lats.ndim == 1 and lons.ndim == 1:
+            # bracket in the grid's own longitude convention so 0-360 axes stay monotonic
+            lon_b = lon % 360 if lons.max() > 180 else lon
+            i0, i1, fi = _bracket(lats, lat)
+            j0, j1, fj = _bracket(lons, lon_b)
+            return [
+                [[i0, j0], (1 - fi) * (1 - fj)],
+                [[i0, j1], (1 - fi) * fj],
+                [[i1, j0], fi * (1 - fj)],
+                [[i1, j1], fi * fj],
+            ]
+        # nearest point (bilinear on curvilinear 2D grids also lands here)
+        lons = np.where(lons > 180, lons - 360, lons)
+        if lats.ndim == 2 and lons.ndim == 2:
+            distances = np.sqrt((lats - lat)**2 + (lons - lon)**2)
+            i, j = np.unravel_index(np.argmin(distances), distances.shape)
+        elif lats.ndim == 1 and lons.ndim == 1:
+            i = np.abs(lats - lat).argmin()
+            j = np.abs(lons - lon).argmin()
+        else:
+            raise ValueError("Unexpected lat/lon array dimensions.")
+        return [[[int(i), int(j)], 1.0]]
+
+
+GRID_INDEX = GridIndex()
+
+
+def gather(field, lats, lons, points, method=None):
+    """Values of a 2D field at every (lat, lon) point in one vectorised gather."""
+    rows, cols, w = GRID_INDEX.gather_plan(lats, lons, points, method)
+    return (np.asarray(field)[rows, cols] * w).sum(axis=1)
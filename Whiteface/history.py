@@ -0,0 +1,257 @@
+import os
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+from filelock import FileLock
+
+from derive import PRECIP_TYPES
+from publish import JSON_DIR, write_json_atomic
+
+# ------------------------
+# SETTINGS
+# ------------------------
+HISTORY_DIR = os.environ.get("GFS_HISTORY_DIR", os.path.join(JSON_DIR, "history"))
+# GFS runs to f384, so cycles older than this before a valid time cannot forecast it
+MAX_LEAD_HOURS = 384
+
+# One row per (cycle, station, forecast hour); each column is a flat
+# little-endian file that only ever grows and is read back as a memmap.
+COLUMNS = {
+    "fhour": "<i2",
+    "tmp975_k": "<f4",
+    "snod_m": "<f4",
+    "prate": "<f4",
+    "csnow": "<f4",
+    "temp_f": "<f4",
+    "snow_rate_in": "<f4",
+    "snow_accum_in": "<f4",
+    "precip_type": "<i1",  # PRECIP_CODES, -1 where PRATE is missing
+}
+PRECIP_CODES = {str(name): code for code, name in enumerate(PRECIP_TYPES)}
+PRECIP_NAMES = {code: name for name, code in PRECIP_CODES.items()}
+
+
+def valid_time(cycle, fhour):
+    """YYYYMMDDHH valid time of forecast hour fhour from cycle YYYYMMDDHH."""
+    return (datetime.strptime(str(cycle), "%Y%m%d%H") + timedelta(hours=int(fhour))).strftime("%Y%m%d%H")
+
+
+def _stat(values, fn, digits):
+    values = values[~np.isnan(values)]
+    return round(float(fn(values)), digits) if values.size else None
+
+
+def daily_summary(cycle, columns):
+    """Per UTC valid date: temp min/max/mean, new snow and precip-type step counts for one series."""
+    fhour = np.asarray(columns["fhour"])
+    dates = np.array([valid_time(cycle, h)[:8] for h in fhour])
+    temp = np.asarray(columns["temp_f"], dtype=float)
+    accum = np.asarray(columns["snow_accum_in"], dtype=float)
+    depth_in = np.maximum(np.asarray(columns["snod_m"], dtype=float) * 39.3701, 0)
+    # new snow is the sum of positive depth increments, credited to the later step's date
+    increments = np.concatenate([[0.0], np.diff(depth_in)])
+    increments = np.where(np.isnan(increments), 0.0, np.maximum(increments, 0.0))
+    precip = np.asarray(columns["precip_type"])
+    days = []
+    for date in sorted(set(dates)):
+        sel = dates == date
+        days.append({
+            "date": date,
+            "steps": int(sel.sum()),
+            "temp_f_min": _stat(temp[sel], np.min, 2),
+            "temp_f_max": _stat(temp[sel], np.max, 2),
+            "temp_f_mean": _stat(temp[sel], np.mean, 2),
+            "new_snow_in": round(float(increments[sel].sum()), 3),
+            "snow_accum_in_max": _stat(accum[sel], np.max, 3),
+            "precip_steps": {name: int((precip[sel] == code).sum()) for name, code in PRECIP_CODES.items()},
+        })
+    return days
+
+
+class HistoryStore:
+    """Append-only columnar store of every cycle's per-station forecast series.
+
+    index.json is the commit point: it holds the committed row count and, per
+    cycle and station, the (start, count) block of rows. Rows written past the
+    committed count by a crashed append are truncated on the next append. A
+    re-run of a cycle appends a new block and the index moves to it.
+
+    Queries never scan the whole store: each cycle's daily summaries are
+    written with its rows to daily/<cycle>.json, and a valid-time query
+    walks the cycles newest first, computing the lead hour from the cycle
+    time and reading only that cycle's block, until it has enough cycles.
+    """
+
+    def __init__(self, path=HISTORY_DIR):
+        self.path = path
+        self.index_path = os.path.join(path, "index.json")
+        self.daily_dir = os.path.join(path, "daily")
+        self._index = None
+        self._index_mtime = None
+        self._maps = {}
+        self._daily = {}
+
+    # ---- index ----
+    def _empty_index(self):
+        return {"rows": 0, "stations": [], "cycles": {}}
+
+    def index(self):
+        """The committed index, reloaded when another process has appended."""
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            return self._empty_index()
+        if self._index is None or mtime != self._index_mtime:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self._index = json.load(f)
+            self._index_mtime = mtime
+            self._maps = {}
+            self._daily = {}
+        return self._index
+
+    def cycles(self):
+        return sorted(self.index()["cycles"])
+
+    def stations(self):
+        return list(self.index()["stations"])
+
+    # ---- writing ----
+    def _column_path(self, name):
+        return os.path.join(self.path, f"{name}.col")
+
+    def append_cycle(self, cycle, blocks):
+        """Append one cycle: blocks = {station name: {column: 1D array, one entry per row}}."""
+        os.makedirs(self.path, exist_ok=True)
+        with FileLock(os.path.join(self.path, ".lock")):
+            self._index = None
+            index = self.index()
+            rows = index["rows"]
+            entry = {}
+            for name in COLUMNS:
+                # drop anything a crashed append left past the committed rows
+                path = self._column_path(name)
+                if os.path.exists(path):
+                    os.truncate(path, rows * np.dtype(COLUMNS[name]).itemsize)
+            for station, columns in blocks.items():
+                n = len(columns["fhour"])
+                for name, dtype in COLUMNS.items():
+                    data = np.asarray(columns[name], dtype=dtype)
+                    if data.shape != (n,):
+                        raise ValueError(f"Column {name} for {station} has {data.size} rows, expected {n}")
+                    with open(self._column_path(name), "ab") as f:
+                        f.write(data.tobytes())
+                if station not in index["stations"]:
+                    index["stations"].append(station)
+                entry[station] = [rows, n]
+                rows += n
+            for name in COLUMNS:
+                with open(self._column_path(name), "ab") as f:
+                    os.fsync(f.fileno())
+            # summaries first, so a committed index always has them
+            daily = {station: daily_summary(cycle, columns) for station, columns in blocks.items()}
+            write_json_atomic(self._daily_path(cycle), daily)
+            index["cycles"][str(cycle)] = entry
+            index["rows"] = rows
+            write_json_atomic(self.index_path, index)
+            self._index = None
+        print(f"Appended cycle {cycle} to history ({sum(b[1] for b in entry.values())} rows)")
+
+    # ---- reading ----
+    def _column(self, name):
+        rows = self.index()["rows"]
+        mm = self._maps.get(name)
+        if mm is None or mm.shape[0] != rows:
+            if rows == 0:
+                mm = np.empty(0, dtype=COLUMNS[name])
+            else:
+                mm = np.memmap(self._column_path(name), dtype=COLUMNS[name], mode="r", shape=(rows,))
+            self._maps[name] = mm
+        return mm
+
+    def block(self, cycle, station):
+        """(start, count) of a cycle/station's rows, or None if it was never stored."""
+        span = self.index()["cycles"].get(str(cycle), {}).get(station)
+        return tuple(span) if span else None
+
+    def series(self, cycle, station, columns=None):
+        """{column: array} of one cycle's rows for a station (views onto the memmaps)."""
+        span = self.block(cycle, station)
+        if span is None:
+            return None
+        start, count = span
+        return {name: self._column(name)[start:start + count] for name in (columns or COLUMNS)}
+
+    # ---- precomputed lookups ----
+    def _daily_path(self, cycle):
+        return os.path.join(self.daily_dir, f"{cycle}.json")
+
+    def _load_daily(self, cycle):
+        path = self._daily_path(cycle)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    def daily(self, cycle, station):
+        """Precomputed daily summaries of one cycle's series for a station, or None.
+
+        Only stored cycles are looked up, so `cycle` never reaches the filesystem unchecked.
+        """
+        cycle = str(cycle)
+        if cycle not in self.index()["cycles"]:
+            return None
+        if cycle not in self._daily:
+            self._daily[cycle] = self._load_daily(cycle)
+        return self._daily[cycle].get(station)
+
+    def _valid_rows(self, station, valid, last=None):
+        """[(cycle, row)] holding station's forecast for valid time `valid`, oldest cycle first.
+
+        Only the newest `last` cycles that have it are looked up, one block each.
+        """
+        index = self.index()
+        target = datetime.strptime(str(valid), "%Y%m%d%H")
+        fhour = self._column("fhour")
+        hits = []
+        for cycle in sorted(index["cycles"], reverse=True):
+            if last and len(hits) >= last:
+                break
+            lead = (target - datetime.strptime(cycle, "%Y%m%d%H")).total_seconds() / 3600
+            if lead < 0:
+                continue
+            if lead > MAX_LEAD_HOURS:
+                break
+            span = index["cycles"][cycle].get(station)
+            if span is None or lead != int(lead):
+                continue
+            start, count = span
+            rows = np.flatnonzero(fhour[start:start + count] == int(lead))
+            if rows.size:
+                hits.append((cycle, start + int(rows[0])))
+        return hits[::-1]
+
+    def forecast_evolution(self, station, valid, last=None, columns=None):
+        """How the forecast for one valid time changed across cycles (newest `last` cycles).
+
+        Returns [{"cycle", "lead_hour", <column>: value, ...}] oldest cycle first.
+        """
+        hits = self._valid_rows(station, valid, last)
+        names = [c for c in (columns or COLUMNS) if c != "fhour"]
+        out = []
+        for cycle, row in hits:
+            item = {"cycle": cycle, "lead_hour": int(self._column("fhour")[row])}
+            for name in names:
+                value = self._column(name)[row].item()
+                if name == "precip_type":
+                    value = PRECIP_NAMES.get(value)
+                elif isinstance(value, float):
+                    # stored as float32; trim the widening noise to its ~7 significant
+                    # digits (a fixed number of decimals would zero PRATE, ~1e-5)
+                    value = None if np.isnan(value) else float(f"{value:.6g}")
+                item[name] = value
+            out.append(item)
+        return out
+
+
+HISTORY = HistoryStore()
@@ -0,0 +1,400 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+import psutil
+
+# ------------------------
+# SETTINGS
+# ------------------------
+# The pipeline's metrics are saved here after each run so every web worker's
+# /metrics reports them, whichever process ran the pipeline.
+PIPELINE_METRICS_PATH = os.environ.get("GFS_METRICS_PATH", "/var/data/pipeline_metrics.json")
+# seconds: sub-millisecond JSON writes up to multi-minute NOMADS stalls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# RSS is sampled this often while a run is in progress, so decode/extract peaks are seen
+RSS_SAMPLE_SECONDS = float(os.environ.get("GFS_RSS_SAMPLE_SECONDS", 0.25))
+
+
+# ------------------------
+# METRIC TYPES
+# ------------------------
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._lines(key, value))
+        return lines
+
+    def _lines(self, key, value):
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"]
+
+    def state(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def load(self, items):
+        with self._lock:
+            self._values = {tuple(key): value for key, value in items}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._values = {}
+
+
+INF_BUCKET = 'le="+Inf"'
+
+
+class Histogram(_Metric):
+    """Bucketed observations; stored per label set as [per-bucket counts, sum, count]."""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            if i < len(self.buckets):
+                entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _lines(self, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            le = f'le="{_format_value(float(bound))}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+        lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, INF_BUCKET)} {count}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+    def load(self, items):
+        # drop state saved with a different bucket layout
+        super().load([item for item in items if len(item[1][0]) == len(self.buckets)])
+
+
+class Registry:
+    """A named set of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._add(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def __getitem__(self, name):
+        return self._metrics[name]
+
+    def render(self):
+        return "".join(line + "\n" for metric in self._metrics.values() for line in metric.render())
+
+    def state(self):
+        return {name: metric.state() for name, metric in self._metrics.items()}
+
+    def load(self, state):
+        for name, items in state.items():
+            if name in self._metrics:
+                self._metrics[name].load(items)
+
+
+def process_metrics():
+    """RSS and CPU time of this process, rendered at scrape time."""
+    proc = psutil.Process()
+    cpu = proc.cpu_times()
+    return (
+        "# HELP process_resident_memory_bytes Resident memory of this process.\n"
+        "# TYPE process_resident_memory_bytes gauge\n"
+        f"process_resident_memory_bytes {proc.memory_info().rss}\n"
+        "# HELP process_cpu_seconds_total User and system CPU time of this process.\n"
+        "# TYPE process_cpu_seconds_total counter\n"
+        f"process_cpu_seconds_total {cpu.user + cpu.system:.3f}\n"
+    )
+
+
+# ------------------------
+# PIPELINE METRICS
+# ------------------------
+def pipeline_registry():
+    """The pipeline's metrics, defined once here for both the pipeline and /metrics."""
+    registry = Registry()
+    registry.histogram("gfs_stage_seconds",
+                       "Time per unit of pipeline work: http_wait and download per request, backoff per retry, "
+                       "decode and extract per step file, json_write per product or snapshot file.", ["stage"])
+    registry.counter("gfs_download_bytes_total", "GRIB bytes downloaded.")
+    registry.counter("gfs_download_requests_total", "GRIB download attempts by HTTP status (or error).", ["status"])
+    registry.counter("gfs_pipeline_runs_total", "Pipeline runs by result.", ["result"])
+    registry.counter("gfs_grib_cache_fields_total",
+                     "Step fields a run needed, by whether the GRIB cache had them (hit) or they were fetched (miss).",
+                     ["result"])
+    registry.gauge("gfs_grib_cache_bytes", "Size of the GRIB field cache after the last eviction.")
+    registry.gauge("gfs_pipeline_last_run_timestamp_seconds", "Unix time the last run finished.")
+    registry.gauge("gfs_pipeline_last_run_phase_seconds", "Wall time of each phase of the last run.", ["phase"])
+    registry.gauge("gfs_pipeline_last_run_product_seconds", "Build time of each product in the last run.",
+                   ["product"])
+    registry.gauge("gfs_pipeline_last_run_steps", "Forecast steps extracted by the last run.")
+    registry.gauge("gfs_pipeline_last_run_peak_rss_bytes", "Peak resident memory of the last run, sampled every "
+                   "GFS_RSS_SAMPLE_SECONDS while it ran.")
+    return registry
+
+
+PIPELINE = pipeline_registry()
+STAGE_SECONDS = PIPELINE["gfs_stage_seconds"]
+DOWNLOAD_BYTES = PIPELINE["gfs_download_bytes_total"]
+DOWNLOAD_REQUESTS = PIPELINE["gfs_download_requests_total"]
+GRIB_CACHE_FIELDS = PIPELINE["gfs_grib_cache_fields_total"]
+GRIB_CACHE_BYTES = PIPELINE["gfs_grib_cache_bytes"]
+
+
+class RunTimings:
+    """Structured timings of the run in progress.
+
+    Per-stage totals, a per-step breakdown of the same stages and bytes, per
+    phase and per product wall times, and the peak RSS seen by a sampler
+    thread that runs from start_sampler() to stop_sampler(). The phase under
+    way and the time of the last recorded work tell a stalled run from a slow
+    one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sampler_stop = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.stages = {}
+            self.steps = {}
+            self.phases = {}
+            self.products = {}
+            self.bytes = 0
+            self.peak_rss = 0
+            self.current_phase = None
+            self.last_activity = self.started
+        self.sample_rss()
+
+    def add(self, stage, seconds, step=None, nbytes=0):
+        with self._lock:
+            total = self.stages.setdefault(stage, {"seconds": 0.0, "count": 0})
+            total["seconds"] += seconds
+            total["count"] += 1
+            self.bytes += nbytes
+            self.last_activity = time.time()
+            if step is not None:
+                entry = self.steps.setdefault(str(step), {})
+                entry[f"{stage}_s"] = round(entry.get(f"{stage}_s", 0.0) + seconds, 4)
+                if nbytes:
+                    entry["bytes"] = entry.get("bytes", 0) + nbytes
+
+    def sample_rss(self):
+        rss = psutil.Process().memory_info().rss
+        with self._lock:
+            self.peak_rss = max(self.peak_rss, rss)
+        return rss
+
+    def _sample_loop(self, stop, interval):
+        while not stop.wait(interval):
+            self.sample_rss()
+
+    def start_sampler(self, interval=RSS_SAMPLE_SECONDS):
+        """Sample RSS every `interval` seconds in the background until stop_sampler()."""
+        self.stop_sampler()
+        self._sampler_stop = threading.Event()
+        threading.Thread(target=self._sample_loop, args=(self._sampler_stop, interval), daemon=True).start()
+
+    def stop_sampler(self):
+        if self._sampler_stop is not None:
+            self._sampler_stop.set()
+            self._sampler_stop = None
+        self.sample_rss()
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "started": self.started,
+                "phase": self.current_phase,
+                "last_activity": self.last_activity,
+                "stages": {k: {"seconds": round(v["seconds"], 4), "count": v["count"]}
+                           for k, v in self.stages.items()},
+                "phases": dict(self.phases),
+                "products": dict(self.products),
+                "steps": dict(sorted(self.steps.items(), key=lambda kv: int(kv[0]))),
+                "bytes": self.bytes,
+                "peak_rss_bytes": self.peak_rss,
+            }
+
+
+RUN = RunTimings()
+_scope = threading.local()
+
+
+@contextmanager
+def for_step(step):
+    """Attribute stage timings recorded on this thread to forecast step `step`."""
+    _scope.step = step
+    try:
+        yield
+    finally:
+        _scope.step = None
+
+
+def observe(stage, seconds, step=None, nbytes=0):
+    """Record one unit of work of a pipeline stage (step defaults to the for_step scope)."""
+    if step is None:
+        step = getattr(_scope, "step", None)
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    RUN.add(stage, seconds, step, nbytes)
+    if nbytes:
+        DOWNLOAD_BYTES.inc(nbytes)
+
+
+@contextmanager
+def timed(stage, step=None):
+    """with timed("decode", step): ... → observe(stage, elapsed)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - t0, step)
+
+
+@contextmanager
+def phase(name):
+    """Wall time of one phase of a run (select_cycle, fetch_extract, publish, ...)."""
+    t0 = time.perf_counter()
+    RUN.current_phase = name
+    try:
+        yield
+    finally:
+        RUN.current_phase = None
+        RUN.phases[name] = round(RUN.phases.get(name, 0.0) + time.perf_counter() - t0, 4)
+        RUN.sample_rss()
+
+
+def product_built(product, seconds):
+    RUN.products[product] = round(seconds, 4)
+
+
+def begin_run():
+    """Start a run: carry the counters on from the last saved run (possibly another process)."""
+    state = load_pipeline_metrics()
+    if state:
+        PIPELINE.load(state.get("metrics", {}))
+    RUN.reset()
+    RUN.start_sampler()
+
+
+def end_run(result, steps_extracted):
+    """Fold the finished run into the last-run gauges and save everything for /metrics."""
+    RUN.stop_sampler()
+    RUN.phases["total"] = round(time.time() - RUN.started, 4)
+    last = RUN.as_dict()
+    PIPELINE["gfs_pipeline_runs_total"].inc(result=result)
+    PIPELINE["gfs_pipeline_last_run_timestamp_seconds"].set(round(time.time(), 3))
+    for name, gauge_key, values in (("phase", "gfs_pipeline_last_run_phase_seconds", last["phases"]),
+                                    ("product", "gfs_pipeline_last_run_product_seconds", last["products"])):
+        gauge = PIPELINE[gauge_key]
+        gauge.clear()
+        for key, seconds in values.items():
+            gauge.set(seconds, **{name: key})
+    PIPELINE["gfs_pipeline_last_run_steps"].set(steps_extracted)
+    PIPELINE["gfs_pipeline_last_run_peak_rss_bytes"].set(last["peak_rss_bytes"])
+    save_pipeline_metrics(last)
+    return last
+
+
+def save_pipeline_metrics(last_run=None):
+    data = {"metrics": PIPELINE.state(), "last_run": last_run or RUN.as_dict()}
+    os.makedirs(os.path.dirname(PIPELINE_METRICS_PATH), exist_ok=True)
+    tmp_path = f"{PIPELINE_METRICS_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, PIPELINE_METRICS_PATH)
+    except Exception as e:
+        print(f"[WARN] Could not save pipeline metrics: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_pipeline_metrics():
+    """The saved {"metrics", "last_run"} of the last run, or None."""
+    try:
+        with open(PIPELINE_METRICS_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        print(f"[WARN] Ignoring unreadable {PIPELINE_METRICS_PATH}: {e}")
+        return None
@@ -0,0 +1,374 @@
+import gc
+import os
+import json
+import time
+import importlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from gfs_fetch import Downloader
+from gfs_plan import (PRODUCT_FIELDS, TMP_975, SNOD_SFC, PRATE_SFC, CSNOW_SFC,
+                      bbox_around, parse_step_schedule)
+from grib_cache import GRIB_CACHE
+from gfs_cycle import select_cycle
+from grib_points import extract_points
+from cycle_manifest import CycleManifest, prune_manifests
+from publish import Snapshot, published_cycle, write_product_json
+from history import HISTORY
+from derive import depth_inches, precip_codes, running_positive_sum
+from metrics import begin_run, end_run, for_step, phase, product_built, save_pipeline_metrics
+from runs import RUNLOG
+from stations import PRIMARY_STATION, STATIONS, station_json_path, station_points, write_station_index
+
+# ------------------------
+# SETTINGS
+# ------------------------
+# Forecast steps per GFS_STEP_SCHEDULE: hourly to f120, 3-hourly to f240, 12-hourly to f384
+FORECAST_STEPS = parse_step_schedule()
+
+# product name -> module exposing build(steps, values, station)
+PRODUCT_MODULES = {
+    "precip_type": "Whiteface_precip_type",
+    "snow_acc": "Whiteface_Snow_ACC_ANL",
+    "temp_975": "Whiteface_TMP_975",
+    "snow_rate": "Whiteface_Snow_rate",
+}
+DEFAULT_PRODUCTS = list(PRODUCT_MODULES)
+
+# Streaming publish: go live with the leading steps as soon as they are
+# extracted, re-publishing at most every STREAM_PUBLISH_SECONDS as more arrive
+STREAM_PUBLISH = os.environ.get("GFS_STREAM_PUBLISH", "0") == "1"
+STREAM_PUBLISH_SECONDS = float(os.environ.get("GFS_STREAM_PUBLISH_SECONDS", 10))
+
+# Gridded map PNGs per step (see gfs_maps); needs matplotlib + cartopy
+MAPS_ENABLED = os.environ.get("GFS_MAPS", "0") == "1"
+
+
+# ------------------------
+# STAGES
+# ------------------------
+def load_products(products):
+    return {p: importlib.import_module(PRODUCT_MODULES[p]) for p in products}
+
+
+def extract_cycle(grib_files, steps, fields, points, manifest):
+    """Read every field once per step for all points and record the values in the manifest.
+
+    grib_files maps each step to its {field: path} in the GRIB cache, or None
+    if its download failed; such steps are skipped and fetched again next run.
+    Fields a step's files lack are recorded as absent. Returns the steps that
+    were extracted successfully.
+    """
+    extracted = []
+    for step in steps:
+        step_files = grib_files.get(step)
+        if not step_files:
+            continue
+        try:
+            with for_step(step):
+                step_values = extract_points(step_files, fields, points)
+        except Exception as e:
+            print(f"[ERROR] Extracting f{step:03d}: {e}")
+            RUNLOG.step(step, "failed", str(e))
+            continue
+        manifest.record(step, fields, step_values)
+        extracted.append(step)
+        RUNLOG.step(step, "extracted")
+    return extracted
+
+
+def station_values(values, k):
+    """Slice the all-station point values down to station k: {field: {step: value}}."""
+    return {field: {step: float(v[k]) for step, v in by_step.items()} for field, by_step in values.items()}
+
+
+def build_for_stations(module, steps, values, stations, out_dir=None):
+    """Build one product for every station. Returns the seconds it took."""
+    t0 = time.perf_counter()
+    for k, station in enumerate(stations):
+        module.build(steps, station_values(values, k), station, out_dir)
+    elapsed = time.perf_counter() - t0
+    # one line per product, not one per station file
+    print(f"Generated {module.PRODUCT} JSON for {len(stations)} stations in {elapsed:.1f}s")
+    return elapsed
+
+
+def build_products(modules, steps, values, stations, out_dir=None):
+    """Run the independent product builders in parallel on the shared point values."""
+    failed = []
+    for name in modules:
+        RUNLOG.product(name, "building")
+    with ThreadPoolExecutor(max_workers=max(len(modules), 1)) as pool:
+        futures = {pool.submit(build_for_stations, module, steps, values, stations, out_dir): name
+                   for name, module in modules.items()}
+        for fut in as_completed(futures):
+            name = futures[fut]
+            try:
+                product_built(name, fut.result())
+                RUNLOG.product(name, "built")
+            except Exception as e:
+                print(f"[ERROR] Building {name}: {e}")
+                RUNLOG.product(name, "failed", str(e))
+                failed.append(name)
+    return failed
+
+
+def history_blocks(steps, values, stations):
+    """Per-station history columns (raw fields plus the products' derived values) for a cycle.
+
+    Everything is derived on (station, time) arrays for all stations at once.
+    """
+    hours = [s for s in steps if any(s in by_step for by_step in values.values())]
+    if not hours:
+        return {}
+    n = len(stations)
+
+    def matrix(field):
+        by_step = values.get(field, {})
+        return np.stack([np.asarray(by_step[h], dtype=float) if h in by_step else np.full(n, np.nan)
+                         for h in hours], axis=1)
+
+    def present(field):
+        return np.array([h in values.get(field, {}) for h in hours])
+
+    tmp = matrix(TMP_975)
+    snod = matrix(SNOD_SFC)
+    prate = matrix(PRATE_SFC)
+    csnow = matrix(CSNOW_SFC)
+    # derived as the product builders do, on the steps each of them uses
+    snow_rate = np.full(snod.shape, np.nan)
+    snow_accum = np.full(snod.shape, np.nan)
+    have_snod = present(SNOD_SFC)
+    if have_snod.any():
+        depths_in = depth_inches(snod[:, have_snod])
+        snow_rate[:, have_snod] = running_positive_sum(depths_in)
+        snow_accum[:, have_snod] = np.round(running_positive_sum(np.round(depths_in, 3)), 3)
+    precip = np.where(present(PRATE_SFC), precip_codes(prate, np.nan_to_num(csnow)), -1)
+    temp_f = np.round((tmp - 273.15) * 9.0 / 5.0 + 32.0, 2)
+
+    blocks = {}
+    for k, station in enumerate(stations):
+        blocks[station.name] = {
+            "fhour": hours,
+            "tmp975_k": tmp[k],
+            "snod_m": snod[k],
+            "prate": prate[k],
+            "csnow": csnow[k],
+            "temp_f": temp_f[k],
+            "snow_rate_in": snow_rate[k],
+            "snow_accum_in": snow_accum[k],
+            "precip_type": precip[k],
+        }
+    return blocks
+
+
+def write_run_metadata(date_str, hour_str, products, steps, stations, failed, complete, product_cycles,
+                       out_dir=None):
+    """Describe the published run (cycle, steps, products) for the dashboard bundle.
+
+    complete is False while a streaming run has only published the leading steps;
+    product_cycles names the cycle each published product file was built from.
+    """
+    data = {
+        "cycle": f"{date_str}{hour_str}",
+        "date": date_str,
+        "hour": hour_str,
+        "built_at": datetime.utcnow().isoformat() + "Z",
+        "complete": complete,
+        "products": products,
+        "failed": failed,
+        "product_cycles": product_cycles,
+        "steps": steps,
+        "stations": [s.name for s in stations],
+    }
+    json_path = station_json_path(PRIMARY_STATION, "run_meta.json", out_dir)
+    write_product_json(json_path, data, indent=4)
+    print(f"Generated run metadata: {json_path}")
+
+
+def seeded_product_cycles(out_dir):
+    """{product: cycle} of the product files a snapshot was seeded with (from its run metadata)."""
+    try:
+        with open(station_json_path(PRIMARY_STATION, "run_meta.json", out_dir), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    return meta["product_cycles"]
+
+
+def publish_snapshot(date_str, hour_str, modules, steps, values, stations, complete):
+    """Build every product for `steps` into a fresh snapshot and make it live. Returns failed products.
+
+    A product that fails keeps its file from the seeded copy of the live
+    snapshot. If that file is from another cycle the set would mix cycles,
+    so the snapshot is discarded and those products are reported as failed.
+    """
+    cycle = f"{date_str}{hour_str}"
+    snapshot = Snapshot(cycle, partial=not complete)
+    try:
+        product_cycles = seeded_product_cycles(snapshot.path)
+        failed = build_products(modules, steps, values, stations, snapshot.path)
+        product_cycles.update({name: cycle for name in modules if name not in failed})
+        write_station_index(stations, snapshot.path)
+        built_steps = sorted({s for by_step in values.values() for s in by_step if s in steps})
+        write_run_metadata(date_str, hour_str, list(modules), built_steps, stations, failed, complete,
+                           product_cycles, snapshot.path)
+    except Exception:
+        snapshot.discard()
+        raise
+    stale = sorted(p for p, c in product_cycles.items() if c != cycle)
+    if len(failed) == len(modules):
+        # nothing new to show; keep serving the current snapshot
+        print("[ERROR] Every product failed to build; snapshot discarded.")
+        snapshot.discard()
+    elif stale:
+        print(f"[ERROR] {', '.join(stale)} would stay on another cycle than GFS {cycle}; snapshot discarded.")
+        snapshot.discard()
+        failed = sorted(set(failed) | set(stale))
+    else:
+        # products that failed keep their previous files (same cycle) from the seeded copy
+        snapshot.commit()
+    return failed
+
+
+def leading_steps(steps, have):
+    """The unbroken run of steps from the start of `steps` that are all in `have`."""
+    ready = []
+    for step in steps:
+        if step not in have:
+            break
+        ready.append(step)
+    return ready
+
+
+def run_pipeline(products=None, steps=None, stations=None, force=False, stream=None, maps=None):
+    """Fetch, extract and publish the given products for every station for the newest GFS cycle.
+
+    Steps already extracted for this cycle (per its manifest) are not fetched
+    again; the JSON is rebuilt from the stored point values. With stream (default
+    GFS_STREAM_PUBLISH) the leading steps are published while the rest are still
+    downloading. With maps (default GFS_MAPS) a map frame per step is rendered
+    from the same files. Returns the names of products that failed to build.
+
+    Stage and phase timings, bytes and peak RSS are recorded in metrics and
+    saved for /metrics when the run ends.
+    """
+    products = list(products or DEFAULT_PRODUCTS)
+    begin_run()
+    try:
+        failed, extracted = _run_pipeline(products, steps, stations, force, stream, maps)
+    except Exception:
+        end_run("error", 0)
+        raise
+    # a run switching cycles builds every product, so failed may name more than were asked for
+    end_run("failed" if set(failed) >= set(products) else "partial" if failed else "success", len(extracted))
+    return failed
+
+
+def _run_pipeline(products, steps, stations, force, stream, maps):
+    steps = list(steps or FORECAST_STEPS)
+    stations = list(stations or STATIONS)
+    stream = STREAM_PUBLISH if stream is None else stream
+    maps = MAPS_ENABLED if maps is None else maps
+    started = time.time()
+    downloader = Downloader()
+    try:
+        # newest published cycle, or the steps published so far in stream mode
+        with phase("select_cycle"):
+            date_str, hour_str, published = select_cycle(steps, downloader=downloader)
+        live = published_cycle()
+        if live is not None and live != f"{date_str}{hour_str}" and set(products) != set(PRODUCT_MODULES):
+            # the new cycle's snapshot must not carry the other products over from the old one
+            print(f"GFS {date_str} {hour_str}z replaces live {live}: building every product.")
+            products = list(DEFAULT_PRODUCTS)
+        modules = load_products(products)
+        fields = sorted({f for p in products for f in PRODUCT_FIELDS[p]})
+        points = station_points(stations)
+        if maps:
+            from gfs_maps import region_points, render_cycle
+            # widen the step-file subregion so it also covers the map
+            bbox = bbox_around(points + region_points())
+        else:
+            bbox = bbox_around(points)
+        manifest = CycleManifest(date_str, hour_str, stations)
+        done = manifest.done_steps(fields)
+        todo = [s for s in published if s not in done]
+        RUNLOG.plan(f"{date_str}{hour_str}", published, todo)
+        print(f"Running {', '.join(products)} for {len(stations)} stations, "
+              f"GFS {date_str} {hour_str}z ({len(todo)} of {len(steps)} steps to fetch)")
+
+        t0 = time.monotonic()
+        extracted = []
+        if todo:
+            # one merged subregion request per step for the fields of every product the cache lacks
+            grib_iter = GRIB_CACHE.iter_cycle(date_str, hour_str, todo, products, bbox=bbox, downloader=downloader)
+            with phase("fetch_extract"):
+                if stream:
+                    last_publish = None
+                    published_count = len(leading_steps(steps, done))
+                    for step, step_files in grib_iter:
+                        RUNLOG.step(step, "missing" if step_files is None else "downloaded")
+                        extracted += extract_cycle({step: step_files}, [step], fields, points, manifest)
+                        ready = leading_steps(steps, done | set(extracted))
+                        due = last_publish is None or time.monotonic() - last_publish >= STREAM_PUBLISH_SECONDS
+                        if len(ready) > published_count and due:
+                            manifest.save()
+                            print(f"Streaming publish: f{ready[0]:03d}-f{ready[-1]:03d} ({len(ready)} steps)")
+                            publish_snapshot(date_str, hour_str, modules, ready, manifest.values(fields), stations,
+                                             complete=False)
+                            published_count = len(ready)
+                            last_publish = time.monotonic()
+                            # a long run shows up on /metrics before it ends
+                            save_pipeline_metrics()
+                else:
+                    grib_files = {}
+                    for step, step_files in grib_iter:
+                        RUNLOG.step(step, "missing" if step_files is None else "downloaded")
+                        grib_files[step] = step_files
+                    extracted = extract_cycle(grib_files, todo, fields, points, manifest)
+            manifest.save()
+    finally:
+        downloader.close()
+    t1 = time.monotonic()
+
+    failed = []
+    if extracted or force or not manifest.published:
+        values = manifest.values(fields)
+        # build into a fresh snapshot; it goes live in one pointer swap
+        complete = set(steps) <= manifest.done_steps(fields)
+        with phase("publish"):
+            failed = publish_snapshot(date_str, hour_str, modules, steps, values, stations, complete)
+        try:
+            # a forced rebuild of unchanged values would only append a duplicate block
+            if extracted or f"{date_str}{hour_str}" not in HISTORY.cycles():
+                with phase("history"):
+                    HISTORY.append_cycle(f"{date_str}{hour_str}", history_blocks(steps, values, stations))
+        except Exception as e:
+            print(f"[WARN] Could not append cycle to history: {e}")
+        if not failed:
+            manifest.mark_published()
+            manifest.save()
+        if maps:
+            try:
+                # fields no run has cached for this cycle render as blank panels
+                with phase("maps"):
+                    render_cycle(date_str, hour_str, published, bbox)
+            except Exception as e:
+                print(f"[ERROR] Rendering maps: {e}")
+    else:
+        print("Cycle already processed and published; nothing to do.")
+    t2 = time.monotonic()
+    print(f"Timings: fetch+extract {t1 - t0:.1f}s ({len(extracted)} new steps), build {t2 - t1:.1f}s")
+
+    # fields this run used stay cached for a re-run or the other products; the cap drops the rest
+    with phase("cleanup"):
+        GRIB_CACHE.evict(keep_since=started)
+        prune_manifests()
+        gc.collect()
+    return failed, extracted
+
+
+if __name__ == "__main__":
+    run_pipeline()
@@ -0,0 +1,170 @@
+import os
+import sys
+import json
+import shutil
+from datetime import datetime
+
+from metrics import timed
+
+# ------------------------
+# SETTINGS
+# ------------------------
+JSON_DIR = "/var/data"
+# Each run publishes into its own directory under SNAPSHOT_DIR; "current" is a
+# symlink to the live one, so readers always see one run's complete set.
+SNAPSHOT_DIR = os.path.join(JSON_DIR, "snapshots")
+CURRENT_LINK = os.path.join(SNAPSHOT_DIR, "current")
+KEEP_SNAPSHOTS = int(os.environ.get("GFS_KEEP_SNAPSHOTS", 8))
+# Marks a streaming run's intermediate snapshots (only the leading steps)
+PARTIAL_SUFFIX = "-partial"
+
+
+# ------------------------
+# FUNCTIONS
+# ------------------------
+def write_json_atomic(path, data, **dump_kwargs):
+    """Write JSON to a temp file next to path and rename it into place.
+
+    A reader sees either the old file or the complete new one, never a
+    truncated write.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_product_json(path, data, **dump_kwargs):
+    """write_json_atomic for a published product or snapshot file, timed as the json_write stage.
+
+    Bookkeeping writes (run progress, the job queue, history) call
+    write_json_atomic directly and stay out of the stage.
+    """
+    with timed("json_write"):
+        write_json_atomic(path, data, **dump_kwargs)
+
+
+def list_snapshots():
+    """Published snapshot names, oldest first (names sort by cycle, then build time)."""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    return sorted(d for d in os.listdir(SNAPSHOT_DIR)
+                  if not d.startswith(".") and d != "current"
+                  and os.path.isdir(os.path.join(SNAPSHOT_DIR, d)))
+
+
+def current_snapshot():
+    """Name of the snapshot "current" points at, or None before the first publish."""
+    if not os.path.islink(CURRENT_LINK):
+        return None
+    return os.path.basename(os.readlink(CURRENT_LINK))
+
+
+def published_cycle():
+    """YYYYMMDDHH of the live snapshot, or None before the first publish."""
+    name = current_snapshot()
+    return name.split("_")[0] if name else None
+
+
+def set_current(name):
+    """Atomically repoint "current" at snapshot `name`."""
+    if not os.path.isdir(os.path.join(SNAPSHOT_DIR, name)):
+        raise ValueError(f"No snapshot named {name}")
+    tmp_link = f"{CURRENT_LINK}.{os.getpid()}.tmp"
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    # relative target so the tree can be moved or mounted elsewhere
+    os.symlink(name, tmp_link)
+    os.replace(tmp_link, CURRENT_LINK)
+
+
+class Snapshot:
+    """A run's output directory, made live in one step by commit().
+
+    It starts as a hard-linked copy of the current snapshot, so a run that
+    only rebuilds some products still publishes a complete set. Builders
+    write into `path` until commit() renames it into place and swaps the
+    pointer; discard() throws it away and leaves "current" untouched. A
+    partial snapshot (a streaming run's leading steps) is named with
+    PARTIAL_SUFFIX and is superseded by the next snapshot of its cycle.
+    """
+
+    def __init__(self, cycle, partial=False):
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")  # streaming publishes several a second
+        self.name = f"{cycle}_{stamp}{PARTIAL_SUFFIX if partial else ''}"
+        self.path = os.path.join(SNAPSHOT_DIR, f".{self.name}.partial")
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        shutil.rmtree(self.path, ignore_errors=True)
+        current = current_snapshot()
+        if current:
+            # files are replaced, never written in place, so sharing inodes is safe
+            shutil.copytree(os.path.join(SNAPSHOT_DIR, current), self.path, copy_function=os.link)
+        else:
+            os.makedirs(self.path)
+
+    def commit(self):
+        final_path = os.path.join(SNAPSHOT_DIR, self.name)
+        os.rename(self.path, final_path)
+        self.path = final_path
+        set_current(self.name)
+        print(f"Published snapshot {self.name}")
+        prune_snapshots()
+
+    def discard(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def rollback(name=None):
+    """Point "current" back at `name`, or at the snapshot before the current one."""
+    names = list_snapshots()
+    if name is None:
+        current = current_snapshot()
+        older = [n for n in names if current is None or n < current]
+        if not older:
+            raise ValueError("No earlier snapshot to roll back to")
+        name = older[-1]
+    set_current(name)
+    print(f"Current snapshot is now {name}")
+    return name
+
+
+def is_partial(name):
+    return name.endswith(PARTIAL_SUFFIX)
+
+
+def prune_snapshots(keep=KEEP_SNAPSHOTS):
+    """Drop partial snapshots superseded by a newer one of their cycle, then all but the newest `keep`.
+
+    A streaming run therefore leaves at most one partial snapshot behind and
+    never pushes complete snapshots of earlier cycles out. The live one is
+    always kept.
+    """
+    current = current_snapshot()
+    names = list_snapshots()
+    superseded = {name for name, newer in zip(names, names[1:])
+                  if is_partial(name) and name.split("_")[0] == newer.split("_")[0]}
+    kept = [name for name in names if name not in superseded]
+    for name in sorted(superseded) + kept[:-keep]:
+        if name != current:
+            shutil.rmtree(os.path.join(SNAPSHOT_DIR, name), ignore_errors=True)
+
+
+# ------------------------
+# MAIN
+# ------------------------
+if __name__ == "__main__":
+    # python publish.py list | rollback [snapshot]
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "rollback":
+        rollback(sys.argv[2] if len(sys.argv) > 2 else None)
+    else:
+        current = current_snapshot()
+        for name in list_snapshots():
+            print(f"{'*' if name == current else ' '} {name}")
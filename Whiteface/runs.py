@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import uuid
+import threading
+from collections import deque
+from datetime import datetime
+
+import psutil
+
+from metrics import RUN
+from publish import JSON_DIR, write_json_atomic
+
+# ------------------------
+# SETTINGS
+# ------------------------
+RUNS_DIR = os.environ.get("GFS_RUNS_DIR", os.path.join(JSON_DIR, "runs"))
+# live progress of the run under way, rewritten while it runs
+CURRENT_PATH = os.path.join(RUNS_DIR, "current.json")
+# the last KEEP_RUNS finished runs, oldest first
+HISTORY_PATH = os.path.join(RUNS_DIR, "history.json")
+KEEP_RUNS = int(os.environ.get("GFS_KEEP_RUNS", 50))
+# minimum spacing of progress writes between state changes
+PROGRESS_SAVE_SECONDS = 1.0
+
+
+def new_id():
+    """Sortable, unique id for a job or run, e.g. 20260116T101500-3f9c2a."""
+    return f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+
+def _now():
+    return datetime.utcnow().isoformat() + "Z"
+
+
+class RunLog:
+    """Live progress of the pipeline run in this process and a ring buffer of finished runs.
+
+    The scheduler opens a run with start() and closes it with finish(); the
+    pipeline reports cycle, step and product progress in between, and each call
+    is a no-op when no run is open (a run from the command line or the
+    benchmark). Timings come from metrics.RUN. Progress is mirrored to
+    current.json and the ring buffer to history.json, so every web worker can
+    answer for a run another worker is executing.
+    """
+
+    def __init__(self, keep=KEEP_RUNS):
+        self._lock = threading.Lock()
+        self.current = None
+        self.history = deque(maxlen=keep)
+        self._history_mtime = None
+        self._saved_at = 0.0
+
+    # ---- run lifecycle (scheduler) ----
+    def start(self, run_id, products, force, requests):
+        with self._lock:
+            self.current = {
+                "id": run_id,
+                "state": "running",
+                "pid": os.getpid(),
+                "products": {p: {"state": "queued"} for p in products},
+                "force": force,
+                "requests": requests,
+                "started": time.time(),
+                "started_at": _now(),
+                "cycle": None,
+                "steps": {},
+                "failed": [],
+                "error": None,
+            }
+        self.save(force=True)
+
+    def finish(self, failed, error=None):
+        with self._lock:
+            run = self.current
+            if run is None:
+                return None
+            self.current = None
+            run.update(self._timings(run))
+            run.pop("idle_seconds", None)
+            run["phase"] = None
+            run["failed"] = list(failed)
+            run["error"] = error
+            run["finished_at"] = _now()
+            if error:
+                run["state"] = "error"
+            elif not failed:
+                run["state"] = "success"
+            else:
+                run["state"] = "failed" if len(failed) == len(run["products"]) else "partial"
+            # the ring buffer keeps step counts and failures; per-step detail stays in current.json
+            summary = {k: v for k, v in run.items() if k != "steps"}
+            summary["step_counts"] = self._step_counts(run["steps"])
+            summary["failed_steps"] = sorted(int(s) for s, e in run["steps"].items() if e["state"] == "failed")
+        self._reload_history()
+        with self._lock:
+            self.history.append(summary)
+            history = list(self.history)
+        write_json_atomic(HISTORY_PATH, history)
+        write_json_atomic(CURRENT_PATH, run)
+        return summary
+
+    # ---- progress (pipeline) ----
+    def plan(self, cycle, published, todo):
+        """The cycle chosen and its steps: already extracted ones are "cached", the rest "pending"."""
+        with self._lock:
+            if self.current is None:
+                return
+            self.current["cycle"] = cycle
+            self.current["steps"] = {str(s): {"state": "pending" if s in todo else "cached"} for s in published}
+        self.save(force=True)
+
+    def step(self, step, state, error=None):
+        """A step moved on: downloaded, missing, extracted or failed."""
+        with self._lock:
+            if self.current is None:
+                return
+            entry = self.current["steps"].setdefault(str(step), {})
+            entry["state"] = state
+            if error:
+                entry["error"] = error
+        self.save()
+
+    def product(self, name, state, error=None):
+        """A product moved on: building, built or failed."""
+        with self._lock:
+            if self.current is None:
+                return
+            entry = self.current["products"].setdefault(name, {})
+            entry["state"] = state
+            if error:
+                entry["error"] = error
+        self.save(force=True)
+
+    # ---- views ----
+    @staticmethod
+    def _step_counts(steps):
+        counts = {}
+        for entry in steps.values():
+            counts[entry["state"]] = counts.get(entry["state"], 0) + 1
+        return counts
+
+    @staticmethod
+    def _timings(run):
+        """Phase, stage, product and per-step timings of the run from metrics.RUN."""
+        timings = RUN.as_dict()
+        if timings["started"] < run["started"]:
+            return {}  # the pipeline has not reset them for this run yet
+        products = run["products"]
+        for name, seconds in timings["products"].items():
+            if name in products:
+                products[name]["seconds"] = seconds
+        for step, stages in timings["steps"].items():
+            if step in run["steps"]:
+                run["steps"][step].update(stages)
+        return {
+            "phase": timings["phase"],
+            "phases": timings["phases"],
+            "stages": timings["stages"],
+            "bytes": timings["bytes"],
+            "peak_rss_bytes": timings["peak_rss_bytes"],
+            "idle_seconds": round(time.time() - timings["last_activity"], 1),
+        }
+
+    def live(self):
+        """The run this process is executing, with current timings, or None."""
+        with self._lock:
+            if self.current is None:
+                return None
+            run = json.loads(json.dumps(self.current))
+        run.update(self._timings(run))
+        run["step_counts"] = self._step_counts(run["steps"])
+        run["updated_at"] = _now()
+        return run
+
+    def save(self, force=False):
+        """Mirror live progress to current.json (at most every PROGRESS_SAVE_SECONDS unless forced)."""
+        if not force and time.monotonic() - self._saved_at < PROGRESS_SAVE_SECONDS:
+            return
+        run = self.live()
+        if run is None:
+            return
+        self._saved_at = time.monotonic()
+        try:
+            write_json_atomic(CURRENT_PATH, run)
+        except Exception as e:
+            print(f"[WARN] Could not save run progress: {e}")
+
+    def current_run(self):
+        """The latest run as any worker sees it: live here, else current.json (marked if its process died)."""
+        run = self.live()
+        if run is not None:
+            return run
+        try:
+            with open(CURRENT_PATH, "r", encoding="utf-8") as f:
+                run = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if run.get("state") == "running" and not psutil.pid_exists(run.get("pid", 0)):
+            run["state"] = "interrupted"
+        return run
+
+    def _reload_history(self):
+        try:
+            mtime = os.stat(HISTORY_PATH).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._history_mtime:
+            return
+        try:
+            with open(HISTORY_PATH, "r", encoding="utf-8") as f:
+                runs = json.load(f)
+        except ValueError as e:
+            print(f"[WARN] Ignoring unreadable run history {HISTORY_PATH}: {e}")
+            return
+        with self._lock:
+            self.history.clear()
+            self.history.extend(runs)
+            self._history_mtime = mtime
+
+    def recent(self, limit=None):
+        """Finished runs, newest first."""
+        self._reload_history()
+        with self._lock:
+            runs = list(self.history)[::-1]
+        return runs[:limit] if limit else runs
+
+    def find(self, run_id):
+        """A run by id: the running one (live) or one in the ring buffer, else None."""
+        current = self.current_run()
+        if current is not None and current["id"] == run_id:
+            return current
+        return next((r for r in self.recent() if r["id"] == run_id), None)
+
+    def find_request(self, job_id):
+        """The newest run that served request `job_id`, or None."""
+        current = self.current_run()
+        if current is not None and job_id in current.get("requests", []):
+            return current
+        return next((r for r in self.recent() if job_id in r.get("requests", [])), None)
+
+
+RUNLOG = RunLog()
@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from filelock import FileLock, Timeout
+
+from publish import JSON_DIR, current_snapshot, is_partial, published_cycle, write_json_atomic
+from runs import RUNLOG, new_id
+
+# ------------------------
+# SETTINGS
+# ------------------------
+SCHEDULER_DIR = os.environ.get("GFS_SCHEDULER_DIR", os.path.join(JSON_DIR, "scheduler"))
+# Held for the whole of a run: one pipeline run at a time across every worker process
+RUN_LOCK_PATH = os.path.join(SCHEDULER_DIR, "run.lock")
+# Guards queue.json; only held while the queue is read and rewritten
+QUEUE_LOCK_PATH = os.path.join(SCHEDULER_DIR, "queue.lock")
+QUEUE_PATH = os.path.join(SCHEDULER_DIR, "queue.json")
+
+# Queue every product when a new cycle is due out (GFS_AUTO_SCHEDULE=0: only on request)
+AUTO_SCHEDULE = os.environ.get("GFS_AUTO_SCHEDULE", "1") == "1"
+# NOMADS has f000 of a cycle about 3.5 h after its nominal time and f384 about 5 h after
+_DEFAULT_DELAY = 210 if os.environ.get("GFS_CYCLE_MODE", "complete") == "stream" else 300
+RELEASE_DELAY = timedelta(minutes=int(os.environ.get("GFS_RELEASE_DELAY_MINUTES", _DEFAULT_DELAY)))
+# While the expected cycle is still not published, queue another attempt this often
+RETRY_SECONDS = int(os.environ.get("GFS_SCHEDULER_RETRY_SECONDS", 600))
+POLL_SECONDS = float(os.environ.get("GFS_SCHEDULER_POLL_SECONDS", 60))
+# How often the scheduler process looks for jobs queued by the web workers
+QUEUE_CHECK_SECONDS = float(os.environ.get("GFS_SCHEDULER_QUEUE_CHECK_SECONDS", 2))
+
+# Every product the scheduler can queue (pipeline.PRODUCT_MODULES names)
+SCHEDULED_PRODUCTS = ["snow_rate", "precip_type", "snow_acc", "temp_975"]
+
+
+# ------------------------
+# CYCLE TIMES
+# ------------------------
+def expected_cycle(now=None):
+    """YYYYMMDDHH of the newest cycle that should be out on NOMADS by now."""
+    t = (now or datetime.utcnow()) - RELEASE_DELAY
+    return t.replace(hour=t.hour // 6 * 6, minute=0, second=0, microsecond=0).strftime("%Y%m%d%H")
+
+
+def next_release(now=None):
+    """When the cycle after expected_cycle(now) is due out."""
+    cycle = datetime.strptime(expected_cycle(now), "%Y%m%d%H")
+    return cycle + timedelta(hours=6) + RELEASE_DELAY
+
+
+# ------------------------
+# SCHEDULER
+# ------------------------
+class Scheduler:
+    """Cross-process job queue in front of run_pipeline.
+
+    Each request gets a job id and queues one entry per product in
+    queue.json. A queued product is never queued twice: a repeat request
+    merges into the waiting entry (force if either asked for it) and adds
+    its job id to it. The web workers only queue and report; the scheduler
+    process (a child of the gunicorn master, see main) drains the queue, and
+    only the holder of the run file lock runs anything. Each drain takes
+    every waiting job as one batch and runs it as a single merged pipeline
+    run, so a batch downloads each step once. Jobs queued meanwhile form the
+    next batch. There are no per-product priorities: a batch builds its
+    products together, and a run that moves to a new cycle builds all of
+    them so the snapshot stays on one cycle.
+
+    With auto set, the loop also queues every product once the next GFS
+    cycle is due out. It queues again every RETRY_SECONDS until that cycle is
+    live and complete, or until the next one is due.
+    """
+
+    def __init__(self, products=None, run_fn=None, on_complete=None, auto=AUTO_SCHEDULE):
+        self.products = list(products or SCHEDULED_PRODUCTS)
+        self.run_fn = run_fn
+        self.on_complete = on_complete
+        self.auto = auto
+        self._run_lock = FileLock(RUN_LOCK_PATH)
+        self._queue_lock = FileLock(QUEUE_LOCK_PATH)
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    # ---- queue file ----
+    def _load(self):
+        try:
+            with open(QUEUE_PATH, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            print(f"[WARN] Resetting unreadable job queue {QUEUE_PATH}: {e}")
+        return {"jobs": [], "running": [], "auto": {}}
+
+    def _update(self, fn):
+        """Apply fn(state) to queue.json under the queue lock; returns fn's result."""
+        os.makedirs(SCHEDULER_DIR, exist_ok=True)
+        with self._queue_lock.acquire(timeout=30):
+            state = self._load()
+            before = json.dumps(state, sort_keys=True)
+            result = fn(state)
+            if json.dumps(state, sort_keys=True) != before:
+                write_json_atomic(QUEUE_PATH, state, indent=2)
+            return result
+
+    def _add(self, state, product, source, force, job_ids):
+        for job in state["jobs"]:
+            if job["product"] == product:
+                job["force"] = job["force"] or force
+                job["job_ids"] += [j for j in job_ids if j not in job["job_ids"]]
+                if source not in job["sources"]:
+                    job["sources"].append(source)
+                return False
+        state["jobs"].append({
+            "product": product,
+            "force": force,
+            "sources": [source],
+            "job_ids": list(job_ids),
+            "queued_at": datetime.utcnow().isoformat() + "Z",
+        })
+        return True
+
+    # ---- requests ----
+    def request(self, products=None, source="manual", force=False):
+        """Queue products (default all); the scheduler process picks them up within QUEUE_CHECK_SECONDS.
+
+        Returns (job id, newly queued products, products merged into waiting entries).
+        """
+        products = list(products or self.products)
+        unknown = [p for p in products if p not in self.products]
+        if unknown:
+            raise ValueError(f"Unknown products: {', '.join(unknown)}")
+        job_id = new_id()
+
+        def add(state):
+            added = [p for p in products if self._add(state, p, source, force, [job_id])]
+            return added, [p for p in products if p not in added]
+
+        added, merged = self._update(add)
+        self._wake.set()
+        return job_id, added, merged
+
+    def status(self):
+        """The queue file as it stands: waiting entries, the running batch, last run id and auto state."""
+        return self._load()
+
+    def job(self, job_id):
+        """Where job `job_id` stands: queued, running (with live progress) or finished; None if unknown.
+
+        A job whose products were queued in separate batches reports the newest run.
+        """
+        state = self._load()
+        waiting = [j for j in state["jobs"] if job_id in j["job_ids"]]
+        running = [j for j in state.get("running", []) if job_id in j["job_ids"]]
+        if running:
+            run = RUNLOG.find(state.get("run_id")) or RUNLOG.current_run()
+            return {"id": job_id, "state": "running", "products": [j["product"] for j in running],
+                    "queued": [j["product"] for j in waiting], "run": run}
+        if waiting:
+            return {"id": job_id, "state": "queued", "products": [j["product"] for j in waiting],
+                    "queued_at": min(j["queued_at"] for j in waiting)}
+        run = RUNLOG.find_request(job_id)
+        if run is None:
+            return None
+        return {"id": job_id, "state": run["state"], "products": list(run["products"]), "run": run}
+
+    def _auto_enqueue(self):
+        cycle = expected_cycle()
+        live = published_cycle()
+        # a streaming run's partial snapshot does not count: keep retrying until the cycle is complete
+        if live is not None and live >= cycle and not is_partial(current_snapshot()):
+            return
+
+        def add(state):
+            auto = state.setdefault("auto", {})
+            if auto.get("cycle") == cycle and time.time() - auto.get("queued_at", 0) < RETRY_SECONDS:
+                return False
+            auto.update(cycle=cycle, queued_at=time.time())
+            for product in self.products:
+                self._add(state, product, f"auto:{cycle}", False, [f"auto-{cycle}"])
+            return True
+
+        if self._update(add):
+            print(f"Scheduler: GFS {cycle} is due (live: {live or 'none'}) → queued all products.")
+
+    # ---- running ----
+    def drain(self):
+        """Run batches until the queue is empty. Returns False if another process holds the run lock."""
+        try:
+            self._run_lock.acquire(timeout=0)
+        except Timeout:
+            return False
+        try:
+            # a batch still marked running here was cut short (the lock dies with its process)
+            def recover(state):
+                stale = state.get("running", [])
+                for job in stale:
+                    self._add(state, job["product"], "recovered", job["force"], job["job_ids"])
+                state["running"] = []
+                return stale
+
+            stale = self._update(recover)
+            if stale:
+                print(f"[WARN] Scheduler: re-queued an interrupted batch ({', '.join(j['product'] for j in stale)}).")
+            while True:
+                def take(state):
+                    batch = sorted(state["jobs"], key=lambda j: j["queued_at"])
+                    if batch:
+                        state["jobs"] = []
+                        state["running"] = batch
+                        state["run_id"] = new_id()
+                        state["running_since"] = datetime.utcnow().isoformat() + "Z"
+                        state["running_pid"] = os.getpid()
+                    return state.get("run_id"), batch
+
+                run_id, batch = self._update(take)
+                if not batch:
+                    break
+                self._run_batch(run_id, batch)
+        finally:
+            self._run_lock.release()
+        return True
+
+    def _run_batch(self, run_id, batch):
+        products = [job["product"] for job in batch]
+        force = any(job["force"] for job in batch)
+        job_ids = list(dict.fromkeys(j for job in batch for j in job["job_ids"]))
+        print(f"Scheduler: run {run_id}: {', '.join(products)}{' (forced)' if force else ''} "
+              f"in process {os.getpid()}")
+        RUNLOG.start(run_id, products, force, job_ids)
+        try:
+            run_fn = self.run_fn
+            if run_fn is None:
+                # imported here so xarray/cfgrib/eccodes load once, on the first run only
+                from pipeline import run_pipeline as run_fn
+            failed = run_fn(products=products, force=force)
+            error = None
+        except Exception:
+            # catch-all so a failure doesn't kill the scheduler thread
+            error = traceback.format_exc()
+            print(f"Unexpected error running pipeline:\n{error}")
+            failed = products
+        # recorded before the batch leaves the queue, so its jobs never go missing in between
+        RUNLOG.finish(failed, error.strip().splitlines()[-1] if error else None)
+
+        def finish(state):
+            state["running"] = []
+            for key in ("run_id", "running_since", "running_pid"):
+                state.pop(key, None)
+            state["last_run_id"] = run_id
+
+        self._update(finish)
+        if failed:
+            print(f"Pipeline finished with failed products: {', '.join(failed)}")
+        else:
+            print("Pipeline ran successfully!")
+        if self.on_complete is not None:
+            try:
+                self.on_complete()
+            except Exception as e:
+                print(f"[WARN] Scheduler completion hook: {e}")
+
+    def _loop(self):
+        while True:
+            try:
+                if self.auto:
+                    self._auto_enqueue()
+                self.drain()
+            except Exception:
+                print(f"[ERROR] Scheduler:\n{traceback.format_exc()}")
+            # wake for the next release, the next poll, or a request
+            until_release = (next_release() - datetime.utcnow()).total_seconds()
+            self._wait(max(1.0, min(POLL_SECONDS, until_release)))
+
+    def _queue_mtime(self):
+        try:
+            return os.stat(QUEUE_PATH).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _wait(self, timeout):
+        """Sleep up to timeout, returning early once another process rewrites the queue."""
+        deadline = time.monotonic() + timeout
+        seen = self._queue_mtime()
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0 or self._wake.wait(min(QUEUE_CHECK_SECONDS, left)):
+                break
+            if self._queue_mtime() != seen:
+                break
+        self._wake.clear()
+
+    def run_forever(self):
+        """Run the scheduler loop in the calling thread."""
+        self._loop()
+
+    def start(self):
+        """Start the scheduler loop in a thread of this process (once); the development server uses this."""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+
+
+def main():
+    """Scheduler process: runs the pipeline outside the gevent web workers.
+
+    The gunicorn master starts it at boot (gunicorn.conf.py), in the same
+    service and on the same disk as the web workers. After a deploy or
+    restart it re-queues any interrupted batch and queues a due cycle right
+    away, without waiting for a request.
+    """
+    print(f"Scheduler: process {os.getpid()} started (auto schedule {'on' if AUTO_SCHEDULE else 'off'}, "
+          f"expecting GFS {expected_cycle()}, next due {next_release():%Y-%m-%d %H:%M}Z).")
+    Scheduler().run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import os
+from collections import namedtuple
+
+from publish import JSON_DIR, write_product_json
+
+# ------------------------
+# SETTINGS
+# ------------------------
+Station = namedtuple("Station", ["name", "lat", "lon", "elevation_m"])
+
+# Whiteface stays first: it is the primary station and keeps the original
+# whiteface_*.json names at the top of the publish root; every other station
+# publishes under its stations/ subdirectory.
+STATIONS = [
+    Station("Whiteface", 44.3659, -73.9023, 1483),
+    Station("Gore", 43.6729, -74.0066, 1097),
+    Station("Hunter", 42.2029, -74.2307, 1231),
+    Station("Jay Peak", 44.9379, -72.5045, 1209),
+    Station("Stowe", 44.5303, -72.7814, 1339),
+    Station("Killington", 43.6045, -72.8201, 1293),
+    Station("Sugarbush", 44.1360, -72.9007, 1244),
+    Station("Sugarloaf", 45.0314, -70.3131, 1291),
+    Station("Sunday River", 44.4735, -70.8564, 957),
+    Station("Cannon", 44.1565, -71.6982, 1245),
+]
+PRIMARY_STATION = STATIONS[0]
+
+
+def station_slug(station):
+    return station.name.lower().replace(" ", "_")
+
+
+def station_json_path(station, suffix, out_dir=None):
+    """Where a product writes its JSON for a station, e.g. suffix="precip_type.json".
+
+    out_dir is the publish root (a run's snapshot directory); it defaults to JSON_DIR.
+    """
+    out_dir = out_dir or JSON_DIR
+    base = out_dir if station == PRIMARY_STATION else os.path.join(out_dir, "stations")
+    os.makedirs(base, exist_ok=True)
+    return os.path.join(base, f"{station_slug(station)}_{suffix}")
+
+
+def station_points(stations):
+    return [(s.lat, s.lon) for s in stations]
+
+
+def write_station_index(stations, out_dir=None):
+    """List the registered stations so clients can discover the per-station files."""
+    data = {
+        "stations": [
+            {"name": s.name, "slug": station_slug(s), "lat": s.lat, "lon": s.lon, "elevation_m": s.elevation_m}
+            for s in stations
+        ]
+    }
+    json_path = os.path.join(out_dir or JSON_DIR, "stations", "index.json")
+    write_product_json(json_path, data, indent=4)
+    print(f"Generated station index: {json_path}")
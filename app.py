@@ -1,15 +1,48 @@
-from flask import Flask, render_template, jsonify, make_response
-import os, json
-import threading, subprocess, traceback, getpass, sys
-from datetime import datetime
+from flask import Flask, Response, g, render_template, jsonify, make_response, request, send_from_directory
+import os, json, time, hashlib, gzip
+import threading, sys
+from collections import namedtuple
+from datetime import datetime, timezone
+
+try:
+    import brotli  # optional: smaller /data/all bodies for clients that accept br
+except ImportError:
+    brotli = None
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# GFS pipeline modules live in Whiteface/ and import each other by bare name
+PIPELINE_DIR = os.path.join(BASE_DIR, "Whiteface")
+if PIPELINE_DIR not in sys.path:
+    sys.path.insert(0, PIPELINE_DIR)
+from history import HISTORY
+from scheduler import Scheduler
+from runs import KEEP_RUNS, RUNLOG
+from metrics import CONTENT_TYPE, Registry, load_pipeline_metrics, pipeline_registry, process_metrics
+from publish import is_partial
+from stations import STATIONS, station_slug
 # Look for the JSON inside /var/data
 JSON_BASE = "/var/data"
 JSON_PATH = os.path.join(JSON_BASE, "whiteface_conditions.json")
-JSON_SNOW_PATH = os.path.join(JSON_BASE, "whiteface_hourly_snow_rate.json")
-JSON_PRECIP_PATH = os.path.join(JSON_BASE, "whiteface_precip_type.json")
-JSON_SNOW_ACC_PATH = os.path.join(JSON_BASE, "whiteface_snod_forecast_running_positive_accum_in.json")
+# GFS products are published as a set into versioned snapshots; "current" points at the live one
+SNAPSHOT_CURRENT = os.path.join(JSON_BASE, "snapshots", "current")
+JSON_SNOW_FILE = "whiteface_hourly_snow_rate.json"
+JSON_PRECIP_FILE = "whiteface_precip_type.json"
+JSON_SNOW_ACC_FILE = "whiteface_snod_forecast_running_positive_accum_in.json"
+JSON_RUN_META_FILE = "whiteface_run_meta.json"
+# rendered map frames (GFS_MAPS=1): index.json plus <cycle>/fNNN.png
+MAPS_DIR = os.path.join(JSON_BASE, "maps")
+
+# HTTP caching: the GFS products are rewritten once per cycle, so clients may
+# reuse them until the next expected refresh and then revalidate with the ETag.
+DATA_REFRESH_SECONDS = int(os.environ.get("DATA_REFRESH_SECONDS", 6 * 3600))
+STALE_WHILE_REVALIDATE = int(os.environ.get("STALE_WHILE_REVALIDATE", 600))
+# The conditions file (and so the /data/all bundle holding it) comes from the
+# separate conditions scraper, not the GFS cycle: only cache it briefly.
+CONDITIONS_MAX_AGE = int(os.environ.get("CONDITIONS_MAX_AGE", 60))
+
+# /events: how often each worker checks the data files, and the keep-alive period
+EVENTS_CHECK_SECONDS = float(os.environ.get("EVENTS_CHECK_SECONDS", 5))
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get("EVENTS_HEARTBEAT_SECONDS", 25))
 
 app = Flask(__name__, template_folder=os.path.join(BASE_DIR, "templates"))
 
@@ -17,121 +50,478 @@ app = Flask(__name__, template_folder=os.path.join(BASE_DIR, "templates"))
 def index():
     return render_template("index.html")
 
-@app.route("/data")
-def data():
-    if not os.path.exists(JSON_PATH):
-        return jsonify({"error": "whiteface_conditions.json not found"}), 404
-    with open(JSON_PATH, "r", encoding="utf-8") as f:
-        payload = json.load(f)
-    resp = make_response(jsonify(payload))
-    # prevent client caching and expose mtime
-    resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+# ------------------------
+# REQUEST METRICS
+# ------------------------
+# Per worker process; the pipeline's own metrics come from the file its last run saved
+HTTP_METRICS = Registry()
+HTTP_REQUESTS = HTTP_METRICS.counter("http_requests_total", "Requests handled by this worker.",
+                                     ["route", "method", "status"])
+HTTP_LATENCY = HTTP_METRICS.histogram("http_request_duration_seconds",
+                                      "Time to produce a response (a streamed body is not included).",
+                                      ["route", "method"])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        # the URL rule, not the path, so /maps/<path:name> stays one series
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_LATENCY.observe(time.perf_counter() - started, route=route, method=request.method)
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    return response
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus text format: this worker's request metrics and process stats, plus the pipeline's."""
+    pipeline = pipeline_registry()
+    saved = load_pipeline_metrics()
+    if saved:
+        pipeline.load(saved.get("metrics", {}))
+    body = HTTP_METRICS.render() + process_metrics() + pipeline.render()
+    response = make_response(body)
+    response.headers["Content-Type"] = CONTENT_TYPE
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+# ------------------------
+# CACHED JSON FILES
+# ------------------------
+CachedJson = namedtuple("CachedJson", ["signature", "body", "mtime", "etag", "last_modified"])
+
+class JsonFileCache:
+    """Keeps each JSON file's serialised response body in memory.
+
+    A request only stats the file; it is re-read and re-serialised when its
+    mtime or size changes. If a new version cannot be parsed (e.g. caught
+    mid-write) the last good body keeps being served.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Return the CachedJson for path; raises FileNotFoundError if it does not exist."""
+        st = os.stat(path)
+        signature = (st.st_mtime_ns, st.st_size)
+        entry = self._entries.get(path)
+        if entry is not None and entry.signature == signature:
+            return entry
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.signature == signature:
+                return entry
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    payload = json.load(f)
+            except ValueError:
+                if entry is not None:
+                    return entry
+                raise
+            body = (app.json.dumps(payload) + "\n").encode("utf-8")
+            mtime = datetime.utcfromtimestamp(st.st_mtime).isoformat() + "Z"
+            etag = hashlib.sha256(body).hexdigest()[:32]
+            last_modified = datetime.fromtimestamp(int(st.st_mtime), tz=timezone.utc)
+            entry = CachedJson(signature, body, mtime, etag, last_modified)
+            # forget files of snapshots that have since been pruned
+            for old in [p for p in self._entries if not os.path.exists(p)]:
+                del self._entries[old]
+            self._entries[path] = entry
+            return entry
+
+JSON_CACHE = JsonFileCache()
+
+def published_dir():
+    """Resolved directory of the live snapshot (flat /var/data before the first one).
+
+    Resolving the pointer once per request keeps every file of a response
+    from the same snapshot even if a publish swaps it mid-way.
+    """
+    if os.path.isdir(SNAPSHOT_CURRENT):
+        return os.path.realpath(SNAPSHOT_CURRENT)
+    return JSON_BASE
+
+def bundle_paths():
+    """Files bundled by /data/all, keyed like the dashboard's boxes, and the run metadata."""
+    base = published_dir()
+    products = {
+        "conditions": JSON_PATH,
+        "snow_rate": os.path.join(base, JSON_SNOW_FILE),
+        "snow_acc": os.path.join(base, JSON_SNOW_ACC_FILE),
+        "precip_type": os.path.join(base, JSON_PRECIP_FILE),
+    }
+    return products, os.path.join(base, JSON_RUN_META_FILE)
+
+def cache_max_age(last_modified):
+    """Seconds until the next expected data refresh (0 once it is overdue)."""
+    next_refresh = last_modified.timestamp() + DATA_REFRESH_SECONDS
+    return max(int(next_refresh - time.time()), 0)
+
+def cache_control(last_modified, complete=True, gfs=True):
+    """Cache-Control for a GFS product (until the next refresh) or other data (CONDITIONS_MAX_AGE).
+
+    A partial (streaming) forecast is revalidated every time.
+    """
+    if not complete:
+        return "no-cache"
+    if not gfs:
+        return f"public, max-age={CONDITIONS_MAX_AGE}"
+    return (f"public, max-age={cache_max_age(last_modified)}, "
+            f"stale-while-revalidate={STALE_WHILE_REVALIDATE}")
+
+def json_file_response(path, complete=True, gfs=True):
+    """Serve a JSON file from the in-memory cache (no parse/dump per request).
+
+    Responses carry a strong content-hash ETag and Last-Modified, so pollers
+    that send If-None-Match / If-Modified-Since get an empty 304 until the
+    file changes. complete=False (a partial snapshot) turns off caching;
+    gfs=False (data not tied to the GFS cycle) keeps it short.
+    """
     try:
-        mtime = datetime.utcfromtimestamp(os.path.getmtime(JSON_PATH)).isoformat() + "Z"
-        resp.headers["X-File-Mtime"] = mtime
-    except Exception:
-        pass
+        entry = JSON_CACHE.get(path)
+    except FileNotFoundError:
+        resp = jsonify({"error": f"{os.path.basename(path)} not found"})
+        resp.status_code = 404
+        resp.headers["Cache-Control"] = "no-store"
+        return resp
+    resp = make_response(entry.body)
+    resp.mimetype = "application/json"
+    resp.set_etag(entry.etag)
+    resp.last_modified = entry.last_modified
+    resp.headers["Cache-Control"] = cache_control(entry.last_modified, complete, gfs)
+    resp.headers["X-File-Mtime"] = entry.mtime
+    return resp.make_conditional(request)
+
+def snapshot_file_response(name):
+    """A product file of the live snapshot; not cacheable while that snapshot is partial."""
+    base = published_dir()
+    return json_file_response(os.path.join(base, name), complete=not is_partial(os.path.basename(base)))
+
+# ------------------------
+# BUNDLED RESPONSE
+# ------------------------
+Bundle = namedtuple("Bundle", ["signature", "etag", "last_modified", "bodies", "complete"])
+
+class BundleCache:
+    """All products plus run metadata in one body, compressed once per data change.
+
+    The bundle is rebuilt only when one of its files' cached ETags changes;
+    identity, gzip and (if available) brotli bodies are kept side by side.
+    """
+
+    def __init__(self, paths_fn):
+        self.paths_fn = paths_fn
+        self._bundle = None
+        self._lock = threading.Lock()
+
+    def _entries(self, paths, meta_path):
+        entries = {}
+        for key, path in list(paths.items()) + [("run", meta_path)]:
+            try:
+                entries[key] = JSON_CACHE.get(path)
+            except FileNotFoundError:
+                entries[key] = None
+        return entries
+
+    def get(self):
+        paths, meta_path = self.paths_fn()
+        entries = self._entries(paths, meta_path)
+        signature = tuple((k, e.etag if e else None) for k, e in entries.items())
+        bundle = self._bundle
+        if bundle is not None and bundle.signature == signature:
+            return bundle
+        with self._lock:
+            if self._bundle is None or self._bundle.signature != signature:
+                self._bundle = self._build(paths, entries, signature)
+            return self._bundle
+
+    def _build(self, paths, entries, signature):
+        data, errors, files = {}, {}, {}
+        for key, path in paths.items():
+            entry = entries[key]
+            if entry is None:
+                data[key] = None
+                errors[key] = f"{os.path.basename(path)} not found"
+                continue
+            data[key] = json.loads(entry.body)
+            files[key] = {"mtime": entry.mtime, "etag": entry.etag}
+        run = json.loads(entries["run"].body) if entries["run"] else None
+        data["meta"] = {
+            "run": run,
+            "files": files,
+            "errors": errors,
+        }
+        body = (app.json.dumps(data) + "\n").encode("utf-8")
+        bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=9)}
+        if brotli is not None:
+            bodies["br"] = brotli.compress(body)
+        known = [e.last_modified for e in entries.values() if e is not None]
+        last_modified = max(known) if known else None
+        complete = run is None or run.get("complete", True)
+        return Bundle(signature, hashlib.sha256(body).hexdigest()[:32], last_modified, bodies, complete)
+
+BUNDLE_CACHE = BundleCache(bundle_paths)
+
+def pick_encoding(bodies):
+    accepted = request.accept_encodings
+    for encoding in ("br", "gzip"):
+        if encoding in bodies and accepted[encoding]:
+            return encoding
+    return "identity"
+
+@app.route("/data/all")
+def data_all():
+    bundle = BUNDLE_CACHE.get()
+    encoding = pick_encoding(bundle.bodies)
+    resp = make_response(bundle.bodies[encoding])
+    resp.mimetype = "application/json"
+    resp.headers["Vary"] = "Accept-Encoding"
+    if encoding != "identity":
+        resp.headers["Content-Encoding"] = encoding
+    # each encoding is a different representation, so it gets its own strong ETag
+    resp.set_etag(bundle.etag if encoding == "identity" else f"{bundle.etag}-{encoding}")
+    if bundle.last_modified is not None:
+        resp.last_modified = bundle.last_modified
+        # bundles the conditions file too, so it is cached like it
+        resp.headers["Cache-Control"] = cache_control(bundle.last_modified, bundle.complete, gfs=False)
+    else:
+        resp.headers["Cache-Control"] = "no-store"
+    return resp.make_conditional(request)
+
+# ------------------------
+# CHANGE NOTIFICATIONS (SSE)
+# ------------------------
+class DataNotifier:
+    """Tells waiting /events streams when the bundled data changes.
+
+    One watcher thread per worker polls the bundle's ETag (a few stats, the
+    files are only re-read when they change), so a run finished by the
+    scheduler process reaches every connected client. Under the gevent worker the threads and
+    condition are green, so idle streams cost almost nothing.
+    """
+
+    def __init__(self, bundle_cache, interval=EVENTS_CHECK_SECONDS):
+        self.bundle_cache = bundle_cache
+        self.interval = interval
+        self.version = 0
+        self.etag = None
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def check(self):
+        etag = self.bundle_cache.get().etag
+        with self._cond:
+            if etag != self.etag:
+                if self.etag is not None:
+                    self.version += 1
+                self.etag = etag
+                self._cond.notify_all()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"[WARN] Data watcher: {e}")
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._watch, daemon=True)
+            self._thread.start()
+        self.check()
+
+    def current(self):
+        with self._cond:
+            return self.version, self.etag
+
+    def wait(self, version, timeout):
+        """Block until the version moves past `version` or timeout; returns (version, etag)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version, timeout)
+            return self.version, self.etag
+
+NOTIFIER = DataNotifier(BUNDLE_CACHE)
+
+@app.route("/events")
+def events():
+    NOTIFIER.start()
+
+    def stream():
+        version, etag = NOTIFIER.current()
+        yield f"retry: 5000\nevent: hello\ndata: {json.dumps({'etag': etag})}\n\n"
+        while True:
+            new_version, etag = NOTIFIER.wait(version, EVENTS_HEARTBEAT_SECONDS)
+            if new_version != version:
+                version = new_version
+                yield f"event: update\ndata: {json.dumps({'etag': etag})}\n\n"
+            else:
+                # comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+
+    resp = Response(stream(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
     return resp
 
+@app.route("/data")
+def data():
+    return json_file_response(JSON_PATH, gfs=False)
+
 # New route: hourly snow rate
 @app.route("/data/snow_rate")
 def snow_rate():
-    if not os.path.exists(JSON_SNOW_PATH):
-        return jsonify({"error": "whiteface_hourly_snow_rate.json not found"}), 404
-    with open(JSON_SNOW_PATH, "r", encoding="utf-8") as f:
-        payload = json.load(f)
-    resp = make_response(jsonify(payload))
-    resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-    try:
-        mtime = datetime.utcfromtimestamp(os.path.getmtime(JSON_SNOW_PATH)).isoformat() + "Z"
-        resp.headers["X-File-Mtime"] = mtime
-    except Exception:
-        pass
-    return resp
+    return snapshot_file_response(JSON_SNOW_FILE)
 
 # New route: precip type
 @app.route("/data/precip_type")
 def precip_type():
-    if not os.path.exists(JSON_PRECIP_PATH):
-        return jsonify({"error": "whiteface_precip_type.json not found"}), 404
-    with open(JSON_PRECIP_PATH, "r", encoding="utf-8") as f:
-        payload = json.load(f)
-    resp = make_response(jsonify(payload))
-    resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-    try:
-        mtime = datetime.utcfromtimestamp(os.path.getmtime(JSON_PRECIP_PATH)).isoformat() + "Z"
-        resp.headers["X-File-Mtime"] = mtime
-    except Exception:
-        pass
-    return resp
+    return snapshot_file_response(JSON_PRECIP_FILE)
 
 # New route: snow accumulation (running positive totals)
 @app.route("/data/snow_acc")
 def snow_acc():
-    if not os.path.exists(JSON_SNOW_ACC_PATH):
-        return jsonify({"error": "whiteface_snod_forecast_running_positive_accum_in.json not found"}), 404
-    with open(JSON_SNOW_ACC_PATH, "r", encoding="utf-8") as f:
-        payload = json.load(f)
-    resp = make_response(jsonify(payload))
-    resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+    return snapshot_file_response(JSON_SNOW_ACC_FILE)
+
+@app.route("/maps/<path:name>")
+def maps(name):
+    # frames never change once written; the index moves to each new cycle
+    max_age = 60 if name == "index.json" else 86400
+    return send_from_directory(MAPS_DIR, name, max_age=max_age)
+
+# ------------------------
+# HISTORY QUERIES
+# ------------------------
+# defaults for /data/history/<station>/forecast
+HISTORY_DEFAULT_CYCLES = 8
+HISTORY_MAX_CYCLES = 40
+
+def history_response(payload):
+    """History answers change once per appended cycle: revalidate via a body ETag."""
+    resp = jsonify(payload)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.add_etag()
+    return resp.make_conditional(request)
+
+def history_station(slug):
+    return next((s.name for s in STATIONS if station_slug(s) == slug), None)
+
+@app.route("/data/history")
+def history_index():
+    return history_response({
+        "cycles": HISTORY.cycles(),
+        "stations": [{"name": s.name, "slug": station_slug(s)} for s in STATIONS],
+    })
+
+@app.route("/data/history/<slug>/forecast")
+def history_forecast(slug):
+    """?valid=YYYYMMDDHH[&cycles=N]: that valid time's forecast from each of the last N cycles."""
+    station = history_station(slug)
+    if station is None:
+        return jsonify({"error": f"unknown station {slug}"}), 404
+    valid = request.args.get("valid", "")
     try:
-        mtime = datetime.utcfromtimestamp(os.path.getmtime(JSON_SNOW_ACC_PATH)).isoformat() + "Z"
-        resp.headers["X-File-Mtime"] = mtime
-    except Exception:
-        pass
-    return resp
+        if len(valid) != 10 or not valid.isdigit():
+            raise ValueError(valid)
+        datetime.strptime(valid, "%Y%m%d%H")
+    except ValueError:
+        return jsonify({"error": "valid must be a YYYYMMDDHH date"}), 400
+    cycles = request.args.get("cycles", HISTORY_DEFAULT_CYCLES, type=int)
+    cycles = min(max(cycles or HISTORY_DEFAULT_CYCLES, 1), HISTORY_MAX_CYCLES)
+    return history_response({
+        "station": station,
+        "valid": valid,
+        "forecasts": HISTORY.forecast_evolution(station, valid, last=cycles),
+    })
+
+@app.route("/data/history/<slug>/daily")
+def history_daily(slug):
+    """?cycle=YYYYMMDDHH (default newest): daily min/max/mean temp, new snow and precip types."""
+    station = history_station(slug)
+    if station is None:
+        return jsonify({"error": f"unknown station {slug}"}), 404
+    cycles = HISTORY.cycles()
+    cycle = request.args.get("cycle") or (cycles[-1] if cycles else None)
+    if cycle not in cycles:
+        return jsonify({"error": f"no history for cycle {cycle}"}), 404
+    days = HISTORY.daily(cycle, station)
+    if days is None:
+        return jsonify({"error": f"no history for {station} cycle {cycle}"}), 404
+    return history_response({"station": station, "cycle": cycle, "days": days})
 
-# Add a global lock so only one background run-task1 can execute at a time
-TASK_LOCK = threading.Lock()
+# ------------------------
+# PIPELINE RUNS
+# ------------------------
+# Runs are queued per product and executed one at a time by the scheduler
+# process, a child of the gunicorn master (gunicorn.conf.py) that also queues
+# new GFS cycles as they come out; the gevent workers here only queue and
+# report, so they stay I/O-bound.
+SCHEDULER = Scheduler()
 
 @app.route("/run-task1")
 def run_task1():
-    # Try to acquire lock without blocking; if already held, return conflict
-    if not TASK_LOCK.acquire(blocking=False):
-        return "Task already running", 409
-
-    def run_all_scripts():
-        try:
-            print("Flask is running as user:", getpass.getuser())  # Print user for debugging
-            scripts = [
-                # Use the required absolute paths under /opt/render
-                ("/opt/render/project/src/Whiteface/Whiteface_precip_type.py", "/opt/render/project/src/Whiteface"),
-                ("/opt/render/project/src/Whiteface/Whiteface_Snow_ACC_ANL.py", "/opt/render/project/src/Whiteface"),
-                ("/opt/render/project/src/Whiteface/Whiteface_TMP_975.py", "/opt/render/project/src/Whiteface"),
-                
-            ]
-            for script, cwd in scripts:
-                if not os.path.exists(script):
-                    print(f"Script not found, skipping: {script}")
-                    continue
-                try:
-                    result = subprocess.run(
-                        [sys.executable, script],
-                        check=True, cwd=cwd,
-                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-                    )
-                    print(f"{os.path.basename(script)} ran successfully!")
-                    print("STDOUT:", result.stdout)
-                    print("STDERR:", result.stderr)
-                except subprocess.CalledProcessError as e:
-                    error_trace = traceback.format_exc()
-                    print(f"Error running {os.path.basename(script)}:\n{error_trace}")
-                    print("STDOUT:", e.stdout)
-                    print("STDERR:", e.stderr)
-                except Exception:
-                    # catch-all so a failure doesn't stop remaining scripts
-                    error_trace = traceback.format_exc()
-                    print(f"Unexpected error running {os.path.basename(script)}:\n{error_trace}")
-        finally:
-            # Always release the lock so future requests can run
-            try:
-                TASK_LOCK.release()
-            except Exception:
-                pass
+    """Queue a pipeline run: ?product=snow_rate,precip_type (default all), &force=1.
+
+    Returns the job id; follow it at /jobs/<id>.
+    """
+    products = [p for p in request.args.get("product", "").split(",") if p] or None
+    force = request.args.get("force") == "1"
+    try:
+        job_id, added, merged = SCHEDULER.request(products, "manual", force)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # merged products were already waiting; this job rides along with that run
+    return jsonify({"job_id": job_id, "state": "queued", "queued": added, "merged": merged,
+                    "status_url": f"/jobs/{job_id}"}), 202
+
+def no_store(payload, status=200):
+    resp = jsonify(payload)
+    resp.status_code = status
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    """A /run-task1 job: queued, running (with the run's live progress) or its finished run."""
+    job = SCHEDULER.job(job_id)
+    if job is None:
+        return no_store({"error": f"unknown job {job_id} (or older than the last {KEEP_RUNS} runs)"}, 404)
+    return no_store(job)
+
+@app.route("/runs")
+def runs_index():
+    """?limit=N (default 20): the latest finished runs, newest first, plus the run under way."""
+    limit = min(max(request.args.get("limit", 20, type=int), 1), KEEP_RUNS)
+    current = RUNLOG.current_run()
+    return no_store({
+        "running": current if current is not None and current["state"] == "running" else None,
+        "queue": SCHEDULER.status()["jobs"],
+        "runs": RUNLOG.recent(limit),
+    })
+
+@app.route("/runs/current")
+def runs_current():
+    """Live per-product and per-step progress of the run under way (or the last one)."""
+    current = RUNLOG.current_run()
+    if current is None:
+        return no_store({"error": "no run yet"}, 404)
+    return no_store(current)
 
-    t = threading.Thread(target=run_all_scripts, daemon=True)
-    t.start()
-    return "Task started in background! Check logs folder for output.", 200
+@app.route("/runs/<run_id>")
+def run_detail(run_id):
+    run = RUNLOG.find(run_id)
+    if run is None:
+        return no_store({"error": f"unknown run {run_id}"}, 404)
+    return no_store(run)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # the development server has no gunicorn master to start it: schedule runs in-process from boot
+    SCHEDULER.start()
+    app.run(host="0.0.0.0", port=5000, debug=True, use_reloader=False)
@@ -0,0 +1,371 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+# GFS pipeline modules live in Whiteface/ and import each other by bare name
+PIPELINE_DIR = os.path.join(ROOT_DIR, "Whiteface")
+for path in (BENCH_DIR, ROOT_DIR, PIPELINE_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+from synthetic_gfs import StubServer, SyntheticGFS, bbox_cells
+
+# ------------------------
+# SETTINGS
+# ------------------------
+# The stub reports every cycle as published, so the phase benchmarks use a fixed one
+DATE_STR = "20260101"
+HOUR_STR = "00"
+DEFAULT_SCHEDULE = "24:1,48:3"
+GRIDS = ("subregion", "global")
+
+# (name, path, request headers); "{etag}" is filled in from a warm-up request
+ROUTES = [
+    ("/data/all", "/data/all", {"Accept-Encoding": "identity"}),
+    ("/data/all gzip", "/data/all", {"Accept-Encoding": "gzip"}),
+    ("/data/all 304", "/data/all", {"Accept-Encoding": "identity", "If-None-Match": "{etag}"}),
+    ("/data/snow_rate", "/data/snow_rate", {"Accept-Encoding": "identity"}),
+    ("/data/precip_type", "/data/precip_type", {"Accept-Encoding": "identity"}),
+    ("/data/snow_acc", "/data/snow_acc", {"Accept-Encoding": "identity"}),
+    ("/data/snow_acc 304", "/data/snow_acc", {"Accept-Encoding": "identity", "If-None-Match": "{etag}"}),
+]
+
+
+# ------------------------
+# FUNCTIONS
+# ------------------------
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, round(time.perf_counter() - t0, 4)
+
+
+def latency_stats(samples):
+    """Latency summary in milliseconds."""
+    ms = np.asarray(samples) * 1000.0
+    if not ms.size:
+        return {}
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def isolate(work_dir):
+    """Point every on-disk location of the pipeline at work_dir so /var/data is never touched.
+
+    Must run before the first product build; returns the pipeline module.
+    """
+    import grib_cache
+    import cycle_manifest
+    import grid_index
+    import publish
+    import history
+    import metrics
+    import pipeline
+
+    grib_cache.GRIB_CACHE.root = os.path.join(work_dir, "grib_cache")
+    cycle_manifest.MANIFEST_DIR = os.path.join(work_dir, "manifests")
+    grid_index.GRID_INDEX.cache_path = os.path.join(work_dir, "grid_index.json")
+    publish.SNAPSHOT_DIR = os.path.join(work_dir, "snapshots")
+    publish.CURRENT_LINK = os.path.join(publish.SNAPSHOT_DIR, "current")
+    pipeline.HISTORY = history.HistoryStore(os.path.join(work_dir, "history"))
+    metrics.PIPELINE_METRICS_PATH = os.path.join(work_dir, "pipeline_metrics.json")
+    return pipeline
+
+
+def prepare_fixtures(source, products, steps, bbox):
+    """Generate every step file the stub will serve, so generation is not timed as download."""
+    from gfs_plan import plan_fields
+    variables = plan_fields(products)[0]
+    paths, seconds = timed(lambda: [source.path_for(variables, step, bbox) for step in steps])
+    return {"files": len(paths), "bytes": sum(os.path.getsize(p) for p in paths), "seconds": seconds}
+
+
+def bench_script(pipeline, work_dir, name, products, steps, bbox, stations):
+    """Time download, decode, extract and publish for one product script (or all of them, merged)."""
+    from gfs_fetch import Downloader
+    from gfs_plan import PRODUCT_FIELDS
+    from grib_cache import GRIB_CACHE
+    from grib_points import read_grids
+    from cycle_manifest import CycleManifest
+    from stations import station_points
+
+    # cold start: nothing left on disk from the previous script
+    shutil.rmtree(os.path.join(work_dir, "grib_cache"), ignore_errors=True)
+    shutil.rmtree(os.path.join(work_dir, "manifests"), ignore_errors=True)
+    fields = sorted({f for p in products for f in PRODUCT_FIELDS[p]})
+    points = station_points(stations)
+    result = {}
+
+    downloader = Downloader()
+    try:
+        files, seconds = timed(GRIB_CACHE.fetch_cycle, DATE_STR, HOUR_STR, steps, products, bbox, downloader)
+    finally:
+        downloader.close()
+    files = {s: f for s, f in files.items() if f}
+    size = sum(os.path.getsize(p) for f in files.values() for p in f.values())
+    result["download"] = {"seconds": seconds, "files": len(files), "missing": len(steps) - len(files),
+                          "bytes": size, "mb_per_s": round(size / 1e6 / seconds, 3) if seconds else None}
+
+    _, seconds = timed(lambda: [read_grids(p, [field]) for f in files.values() for field, p in f.items()])
+    result["decode"] = {"seconds": seconds, "files": len(files)}
+
+    manifest = CycleManifest(DATE_STR, HOUR_STR, stations)
+    extracted, seconds = timed(pipeline.extract_cycle, files, steps, fields, points, manifest)
+    result["extract"] = {"seconds": seconds, "steps": len(extracted), "points": len(points)}
+
+    values = manifest.values(fields)
+    modules = pipeline.load_products(products)
+    if len(modules) == 1:
+        out_dir = os.path.join(work_dir, "products", name)
+        _, seconds = timed(pipeline.build_for_stations, next(iter(modules.values())), steps, values,
+                           stations, out_dir)
+        result["publish"] = {"seconds": seconds}
+    else:
+        # the merged run publishes a real snapshot, which the route benchmark then serves
+        failed, seconds = timed(pipeline.publish_snapshot, DATE_STR, HOUR_STR, modules, steps, values,
+                                stations, True)
+        result["publish"] = {"seconds": seconds, "failed": failed}
+    return result
+
+
+def bench_cycle(pipeline, work_dir, steps):
+    """End-to-end run_pipeline for a cold cycle (probe, fetch, extract, publish, history)."""
+    for name in ("grib_cache", "manifests", "history"):
+        shutil.rmtree(os.path.join(work_dir, name), ignore_errors=True)
+    from metrics import RUN
+    failed, seconds = timed(pipeline.run_pipeline, steps=steps, force=True, stream=False, maps=False)
+    run = RUN.as_dict()
+    return {"seconds": seconds, "failed": failed, "phases": run["phases"], "stages": run["stages"],
+            "peak_rss_bytes": run["peak_rss_bytes"]}
+
+
+def serve_app(work_dir):
+    """Serve the dashboard app from the benchmark's snapshots on a local threaded server."""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    import app as dashboard
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    dashboard.SNAPSHOT_CURRENT = os.path.join(work_dir, "snapshots", "current")
+    dashboard.JSON_PATH = os.path.join(work_dir, "whiteface_conditions.json")
+    server = make_server("127.0.0.1", 0, dashboard.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def bench_route(base_url, path, headers, clients, total):
+    """Hit one route with `clients` concurrent keep-alive clients, `total` requests overall."""
+    with requests.Session() as warm:
+        r = warm.get(base_url + path, headers={k: v for k, v in headers.items() if v != "{etag}"})
+        etag = r.headers.get("ETag", "")
+    headers = {k: v.replace("{etag}", etag) for k, v in headers.items()}
+    per_client = max(1, total // clients)
+
+    def client(_):
+        samples, statuses, size = [], {}, 0
+        with requests.Session() as session:
+            for _ in range(per_client):
+                t0 = time.perf_counter()
+                try:
+                    r = session.get(base_url + path, headers=headers)
+                    size += int(r.headers.get("Content-Length", len(r.content)))
+                    status = str(r.status_code)
+                except requests.RequestException:
+                    status = "error"
+                samples.append(time.perf_counter() - t0)
+                statuses[status] = statuses.get(status, 0) + 1
+        return samples, statuses, size
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(client, range(clients)))
+    seconds = time.perf_counter() - t0
+    samples = [s for r in results for s in r[0]]
+    statuses = {}
+    for _, st, _ in results:
+        for code, n in st.items():
+            statuses[code] = statuses.get(code, 0) + n
+    return {
+        "requests": len(samples),
+        "clients": clients,
+        "seconds": round(seconds, 4),
+        "rps": round(len(samples) / seconds, 1),
+        "status": statuses,
+        "bytes_per_response": round(sum(r[2] for r in results) / max(len(samples), 1)),
+        **latency_stats(samples),
+    }
+
+
+def compare(report, baseline, threshold):
+    """Phases and route p95s that got slower than the baseline by more than `threshold`."""
+    regressions = []
+
+    def check(label, new, old):
+        if new is not None and old and new > old * (1 + threshold):
+            regressions.append(f"{label}: {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+
+    for grid, scripts in report.get("pipeline", {}).items():
+        for script, phases in scripts.items():
+            for phase, stats in phases.items():
+                old = baseline.get("pipeline", {}).get(grid, {}).get(script, {}).get(phase, {})
+                check(f"{grid}/{script}/{phase} seconds", stats.get("seconds"), old.get("seconds"))
+    for grid, stats in report.get("cycle", {}).items():
+        check(f"{grid}/cycle seconds", stats.get("seconds"), baseline.get("cycle", {}).get(grid, {}).get("seconds"))
+    for route, stats in report.get("routes", {}).items():
+        check(f"{route} p95_ms", stats.get("p95_ms"), baseline.get("routes", {}).get(route, {}).get("p95_ms"))
+    return regressions
+
+
+def print_summary(report):
+    for grid, scripts in report["pipeline"].items():
+        print(f"\n{grid} ({report['fixtures'][grid]['cells']} grid points per field)")
+        print(f"  {'script':<14}{'download':>10}{'decode':>10}{'extract':>10}{'publish':>10}")
+        for script, phases in scripts.items():
+            print(f"  {script:<14}" + "".join(f"{phases[p]['seconds']:>9.3f}s"
+                                              for p in ("download", "decode", "extract", "publish")))
+        if grid in report["cycle"]:
+            print(f"  end-to-end cycle: {report['cycle'][grid]['seconds']:.3f}s")
+    if report["routes"]:
+        print(f"\n  {'route':<22}{'rps':>9}{'p50':>10}{'p95':>10}{'p99':>10}  status")
+        for route, r in report["routes"].items():
+            print(f"  {route:<22}{r['rps']:>9.1f}{r['p50_ms']:>8.2f}ms{r['p95_ms']:>8.2f}ms"
+                  f"{r['p99_ms']:>8.2f}ms  {r['status']}")
+
+
+# ------------------------
+# MAIN
+# ------------------------
+# python bench/run_bench.py [--grids subregion,global] [--latency 0.2 --bandwidth 2e6] [--baseline old.json]
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the GFS pipeline and /data routes on synthetic data.")
+    parser.add_argument("--schedule", default=DEFAULT_SCHEDULE, help="step schedule, as GFS_STEP_SCHEDULE")
+    parser.add_argument("--grids", default="subregion", help=f"comma-separated subset of {','.join(GRIDS)}")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub latency per request (s)")
+    parser.add_argument("--bandwidth", type=float, default=None, help="stub bytes/s per connection")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients per route")
+    parser.add_argument("--requests", type=int, default=400, help="requests per route")
+    parser.add_argument("--skip-cycle", action="store_true", help="skip the end-to-end run_pipeline timing")
+    parser.add_argument("--skip-routes", action="store_true")
+    parser.add_argument("--fixtures", default=None, help="keep generated GRIB fixtures here between runs")
+    parser.add_argument("--out", default="bench_report.json")
+    parser.add_argument("--baseline", default=None, help="earlier report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    grids = [g.strip() for g in args.grids.split(",") if g.strip()]
+    if not set(grids) <= set(GRIDS):
+        parser.error(f"--grids must be a subset of {','.join(GRIDS)}")
+    work_dir = tempfile.mkdtemp(prefix="gfs_bench_")
+    source = SyntheticGFS(args.fixtures or os.path.join(work_dir, "synthetic"))
+    stub = StubServer(source, args.latency, args.bandwidth).start()
+    # read at import time by gfs_fetch / gfs_cycle
+    os.environ["GFS_FILTER_URL"] = stub.filter_url
+    os.environ["GFS_PROD_URL"] = stub.prod_url
+    os.environ["GFS_STEP_SCHEDULE"] = args.schedule
+    # the served app must not start pipeline runs of its own
+    os.environ["GFS_AUTO_SCHEDULE"] = "0"
+    os.environ["GFS_SCHEDULER_DIR"] = os.path.join(work_dir, "scheduler")
+
+    try:
+        pipeline = isolate(work_dir)
+        from gfs_fetch import MAX_WORKERS
+        from gfs_plan import bbox_around, parse_step_schedule
+        from stations import STATIONS, station_points
+
+        steps = parse_step_schedule(args.schedule)
+        stations = list(STATIONS)
+        report = {
+            "generated_at": datetime.utcnow().isoformat() + "Z",
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "settings": {
+                "schedule": args.schedule, "steps": len(steps), "stations": len(stations),
+                "grids": grids, "latency_s": args.latency, "bandwidth_bps": args.bandwidth,
+                "download_workers": MAX_WORKERS, "clients": args.clients, "requests": args.requests,
+            },
+            "fixtures": {},
+            "pipeline": {},
+            "cycle": {},
+            "routes": {},
+        }
+        scripts = [(p, [p]) for p in pipeline.DEFAULT_PRODUCTS] + [("all", list(pipeline.DEFAULT_PRODUCTS))]
+        for grid in grids:
+            bbox = bbox_around(station_points(stations)) if grid == "subregion" else None
+            print(f"Generating {grid} fixtures for {len(steps)} steps...")
+            fixtures = {"cells": bbox_cells(bbox), "scripts": {}}
+            for name, products in scripts:
+                fixtures["scripts"][name] = prepare_fixtures(source, products, steps, bbox)
+            report["fixtures"][grid] = fixtures
+            report["pipeline"][grid] = {}
+            for name, products in scripts:
+                print(f"Benchmarking {name} on the {grid} grid...")
+                report["pipeline"][grid][name] = bench_script(pipeline, work_dir, name, products, steps,
+                                                              bbox, stations)
+            if not args.skip_cycle and grid == "subregion":
+                # run_pipeline always requests the station subregion
+                report["cycle"][grid] = bench_cycle(pipeline, work_dir, steps)
+        report["stub"] = {"requests": stub.requests, "bytes": stub.bytes_sent}
+
+        if not args.skip_routes:
+            if "subregion" not in grids and not os.path.isdir(os.path.join(work_dir, "snapshots", "current")):
+                print("[WARN] No snapshot published; route benchmark skipped.")
+            else:
+                server, base_url = serve_app(work_dir)
+                try:
+                    for name, path, headers in ROUTES:
+                        print(f"Load testing {name}...")
+                        report["routes"][name] = bench_route(base_url, path, headers, args.clients,
+                                                             args.requests)
+                finally:
+                    server.shutdown()
+    finally:
+        stub.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print_summary(report)
+    print(f"\nWrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"[WARN] Regression: {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold * 100:.0f}% against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
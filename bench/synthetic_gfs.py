@@ -0,0 +1,266 @@
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import eccodes
+
+# ------------------------
+# SETTINGS
+# ------------------------
+GRID_RES = 0.25
+CHUNK_SIZE = 64 * 1024
+
+# filter variable -> GRIB keys of the message that stands in for it
+# (matches gfs_plan.GRIB_KEYS so the pipeline picks the messages back out)
+FIELD_KEYS = {
+    "TMP": {"shortName": "t", "typeOfFirstFixedSurface": 100, "level": 975},
+    "SNOD": {"shortName": "sde"},
+    "PRATE": {"shortName": "prate"},
+    "CSNOW": {"shortName": "csnow"},
+}
+
+
+# ------------------------
+# SYNTHETIC GRIB
+# ------------------------
+def grid_axes(bbox=None):
+    """Latitude (north to south) and longitude (0-360) axes of the global 0.25° grid or a subregion."""
+    if bbox is None:
+        return 90.0 - GRID_RES * np.arange(721), GRID_RES * np.arange(1440)
+    top, bottom, left, right = bbox
+    nj = int(round((top - bottom) / GRID_RES)) + 1
+    ni = int(round((right - left) / GRID_RES)) + 1
+    return top - GRID_RES * np.arange(nj), (left % 360) + GRID_RES * np.arange(ni)
+
+
+def field_values(variable, lats, lons, step):
+    """Smooth, step-dependent GFS-like values on the grid (deterministic, no RNG)."""
+    lat2, lon2 = np.meshgrid(np.radians(lats), np.radians(lons), indexing="ij")
+    wave = np.sin(3 * lon2 + step / 24.0) * np.cos(2 * lat2)
+    tmp = 288.0 - 30.0 * np.sin(lat2) ** 2 + 6.0 * wave
+    if variable == "TMP":
+        return tmp
+    if variable == "SNOD":
+        return np.clip(0.02 * (273.0 - tmp) + 0.001 * step * (wave > 0), 0.0, None)
+    if variable == "PRATE":
+        return np.clip(wave, 0.0, None) * 2e-3
+    if variable == "CSNOW":
+        return ((tmp < 273.0) & (wave > 0)).astype(float)
+    raise ValueError(f"No synthetic field for {variable}")
+
+
+def make_grib(variables, step, bbox=None, date=20260101, hour=0):
+    """GRIB2 bytes with one message per variable, like a filter_gfs_0p25.pl response."""
+    lats, lons = grid_axes(bbox)
+    out = []
+    for variable in variables:
+        gid = eccodes.codes_grib_new_from_samples("regular_ll_sfc_grib2")
+        try:
+            eccodes.codes_set(gid, "Ni", lons.size)
+            eccodes.codes_set(gid, "Nj", lats.size)
+            eccodes.codes_set(gid, "latitudeOfFirstGridPointInDegrees", float(lats[0]))
+            eccodes.codes_set(gid, "longitudeOfFirstGridPointInDegrees", float(lons[0]))
+            eccodes.codes_set(gid, "latitudeOfLastGridPointInDegrees", float(lats[-1]))
+            eccodes.codes_set(gid, "longitudeOfLastGridPointInDegrees", float(lons[-1]))
+            eccodes.codes_set(gid, "iDirectionIncrementInDegrees", GRID_RES)
+            eccodes.codes_set(gid, "jDirectionIncrementInDegrees", GRID_RES)
+            eccodes.codes_set(gid, "dataDate", date)
+            eccodes.codes_set(gid, "dataTime", hour * 100)
+            for key, value in FIELD_KEYS[variable].items():
+                eccodes.codes_set(gid, key, value)
+            eccodes.codes_set(gid, "stepRange", str(step))
+            eccodes.codes_set_values(gid, field_values(variable, lats, lons, step).ravel())
+            out.append(eccodes.codes_get_message(gid))
+        finally:
+            eccodes.codes_release(gid)
+    return b"".join(out)
+
+
+class SyntheticGFS:
+    """Synthetic step files generated on first use and kept on disk under root."""
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, variables, step, bbox=None):
+        variables = sorted(variables)
+        region = "global" if bbox is None else "_".join(f"{v:g}" for v in bbox)
+        path = os.path.join(self.root, f"{'-'.join(variables)}_f{step:03d}_{region}.grib2")
+        if not os.path.exists(path):
+            with self._lock:
+                if not os.path.exists(path):
+                    data = make_grib(variables, step, bbox)
+                    with open(f"{path}.tmp", "wb") as f:
+                        f.write(data)
+                    os.replace(f"{path}.tmp", path)
+        return path
+
+
+# ------------------------
+# NOMADS STUB
+# ------------------------
+class StubServer:
+    """Local stand-in for filter_gfs_0p25.pl and the prod .idx listing.
+
+    latency (s) is added before every response; bandwidth (bytes/s per
+    connection, None = unthrottled) paces the body. Every cycle is reported
+    as published up to max_step.
+
+    faults are answered, in order, to the next filter requests instead of the
+    GRIB: an HTTP status (e.g. 503), a (status, retry_after) pair, or
+    "truncate" (headers for the whole file, then half of it and a dropped
+    connection).
+    """
+
+    def __init__(self, source, latency=0.0, bandwidth=None, max_step=384, host="127.0.0.1", port=0,
+                 faults=None):
+        self.source = source
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.max_step = max_step
+        self.faults = list(faults or [])
+        self.faults_served = 0
+        self.requests = 0
+        self.bytes_sent = 0
+        self._count_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def filter_url(self):
+        return f"{self.base_url}/cgi-bin/filter_gfs_0p25.pl"
+
+    @property
+    def prod_url(self):
+        return f"{self.base_url}/pub/data/nccf/com/gfs/prod"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _idx_status(self):
+                m = re.search(r"\.f(\d{3})\.idx$", urlparse(self.path).path)
+                return 200 if m and int(m.group(1)) <= stub.max_step else 404
+
+            def do_HEAD(self):
+                time.sleep(stub.latency)
+                self.send_response(self._idx_status())
+                self.end_headers()
+
+            def do_GET(self):
+                time.sleep(stub.latency)
+                url = urlparse(self.path)
+                if url.path.endswith(".idx"):
+                    status = self._idx_status()
+                    self.send_response(status)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if not url.path.endswith("filter_gfs_0p25.pl"):
+                    self.send_error(404)
+                    return
+                qs = parse_qs(url.query, keep_blank_values=True)
+                m = re.search(r"\.f(\d{3})$", qs.get("file", [""])[0])
+                variables = [k[4:] for k in qs if k.startswith("var_") and k[4:] in FIELD_KEYS]
+                if not m or not variables:
+                    self.send_error(400, "bad filter request")
+                    return
+                bbox = None
+                if "subregion" in qs:
+                    bbox = tuple(float(qs[k][0]) for k in ("toplat", "bottomlat", "leftlon", "rightlon"))
+                path = stub.source.path_for(variables, int(m.group(1)), bbox)
+                size = os.path.getsize(path)
+                fault = stub._next_fault()
+                if fault == "truncate":
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(size))
+                    self.end_headers()
+                    with open(path, "rb") as f:
+                        self.wfile.write(f.read(size // 2))
+                    self.close_connection = True
+                    return
+                if fault is not None:
+                    status, retry_after = fault if isinstance(fault, tuple) else (fault, None)
+                    self.send_response(status)
+                    if retry_after is not None:
+                        self.send_header("Retry-After", str(retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(size))
+                self.end_headers()
+                with open(path, "rb") as f:
+                    while True:
+                        chunk = f.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+                        if stub.bandwidth:
+                            time.sleep(len(chunk) / stub.bandwidth)
+                with stub._count_lock:
+                    stub.requests += 1
+                    stub.bytes_sent += size
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _next_fault(self):
+        with self._count_lock:
+            if not self.faults:
+                return None
+            self.faults_served += 1
+            return self.faults.pop(0)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def bbox_cells(bbox):
+    """Grid points in a subregion (or the global grid)."""
+    lats, lons = grid_axes(bbox)
+    return lats.size * lons.size
+
+
+# ------------------------
+# MAIN
+# ------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve synthetic GFS files like NOMADS' filter_gfs_0p25.pl.")
+    parser.add_argument("--root", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "synthetic"))
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--bandwidth", type=float, default=None, help="bytes/s per connection")
+    parser.add_argument("--max-step", type=int, default=384, help="last step reported as published")
+    args = parser.parse_args()
+    stub = StubServer(SyntheticGFS(args.root), args.latency, args.bandwidth, args.max_step, port=args.port)
+    print(f"GFS_FILTER_URL={stub.filter_url}")
+    print(f"GFS_PROD_URL={stub.prod_url}")
+    sys.stdout.flush()
+    try:
+        stub.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+import threading
+import subprocess
+
+# ------------------------
+# SETTINGS
+# ------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEDULER_SCRIPT = os.path.join(BASE_DIR, "Whiteface", "scheduler.py")
+# seconds between checks that the scheduler process is still alive
+SCHEDULER_CHECK_SECONDS = 30
+
+# gevent workers only serve requests and /events streams, so each holds many idle connections
+worker_class = "gevent"
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+worker_connections = int(os.environ.get("WORKER_CONNECTIONS", 2000))
+
+
+# ------------------------
+# SCHEDULER PROCESS
+# ------------------------
+# The pipeline runs in a child of the gunicorn master, not in a gevent worker:
+# its blocking eccodes/numpy work and thread pools would otherwise stall every
+# connection on that worker. Being part of the web service, it writes to the
+# same disk the workers serve from.
+_scheduler = {"proc": None, "stopping": False}
+
+
+def _spawn_scheduler(server):
+    proc = subprocess.Popen([sys.executable, SCHEDULER_SCRIPT], cwd=BASE_DIR)
+    server.log.info("Started scheduler process %s", proc.pid)
+    _scheduler["proc"] = proc
+
+
+def _watch_scheduler(server):
+    """Restart the scheduler if it exits; the run lock re-queues a batch it was running."""
+    while not _scheduler["stopping"]:
+        time.sleep(SCHEDULER_CHECK_SECONDS)
+        proc = _scheduler["proc"]
+        if proc is not None and proc.poll() is not None and not _scheduler["stopping"]:
+            server.log.warning("Scheduler process %s exited with %s; restarting", proc.pid, proc.returncode)
+            _spawn_scheduler(server)
+
+
+def when_ready(server):
+    # at boot, so cycle-triggered runs do not wait for the first request
+    _spawn_scheduler(server)
+    threading.Thread(target=_watch_scheduler, args=(server,), daemon=True).start()
+
+
+def on_exit(server):
+    _scheduler["stopping"] = True
+    proc = _scheduler["proc"]
+    if proc is not None and proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
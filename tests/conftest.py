@@ -0,0 +1,9 @@
+import os
+import sys
+
+# GFS pipeline modules live in Whiteface/ and import each other by bare name;
+# bench/ holds the synthetic GRIB source and the NOMADS stub server
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(ROOT_DIR, "bench"), os.path.join(ROOT_DIR, "Whiteface")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
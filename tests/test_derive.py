@@ -0,0 +1,147 @@
+import math
+
+import numpy as np
+import pytest
+
+from derive import precip_codes, precip_types, running_positive_sum
+
+
+# ------------------------
+# REFERENCE LOOPS
+# ------------------------
+# The per-element loops derive.py replaced, kept verbatim as the reference.
+def old_hourly_snow(snow_depths):
+    """Whiteface_Snow_rate.compute_hourly_snow before vectorisation."""
+    hourly_snow = []
+    accumulated_snow = 0
+    for i in range(len(snow_depths)):
+        if i == 0 or snow_depths[i] <= snow_depths[i - 1]:
+            accumulated_snow = 0
+            hourly_snow.append(0)
+        else:
+            increment = max(snow_depths[i] - snow_depths[i - 1], 0)
+            accumulated_snow += increment
+            hourly_snow.append(accumulated_snow)
+    return hourly_snow
+
+
+def old_positive_accum(depths):
+    """Whiteface_Snow_ACC_ANL.compute_positive_accum before vectorisation."""
+    running = []
+    total = 0.0
+    accumulating = False
+    for i in range(len(depths)):
+        if i == 0:
+            inc = 0.0
+            total = 0.0
+            accumulating = False
+        else:
+            inc = max(depths[i] - depths[i - 1], 0.0)
+            if inc > 0:
+                if not accumulating:
+                    total = 0.0
+                    accumulating = True
+                total += inc
+            else:
+                total = 0.0
+                accumulating = False
+        running.append(round(total, 3))
+    return running
+
+
+def old_classify_precip(prate, csnow):
+    """Whiteface_precip_type.classify_precip before vectorisation."""
+    csnow = csnow * 3600
+    prate = prate * 3600
+    if csnow > 0:
+        return "snow"
+    elif prate > 0:
+        return "rain"
+    else:
+        return "none"
+
+
+SERIES = {
+    "empty": [],
+    "single": [1.25],
+    "equal_steps": [2.0, 2.0, 2.0, 2.0],
+    "rising": [0.0, 0.1, 0.35, 0.9, 1.7],
+    "drops": [0.0, 0.5, 1.2, 0.8, 0.8, 1.1, 1.9, 0.0, 0.3],
+    "all_falling": [3.0, 2.0, 1.0, 0.0],
+    "tiny_increments": [0.0, 1e-9, 2e-9, 2e-9, 0.1 + 0.2],
+}
+
+
+# ------------------------
+# TESTS
+# ------------------------
+@pytest.mark.parametrize("name", sorted(SERIES))
+def test_running_positive_sum_matches_snow_rate_loop(name):
+    series = SERIES[name]
+    assert running_positive_sum(series)[0].tolist() == old_hourly_snow(series)
+
+
+@pytest.mark.parametrize("name", sorted(SERIES))
+def test_running_positive_sum_matches_snow_acc_loop(name):
+    series = SERIES[name]
+    new = [round(total, 3) for total in running_positive_sum(series)[0].tolist()]
+    assert new == old_positive_accum(series)
+
+
+def test_running_positive_sum_matches_loops_on_random_series():
+    rng = np.random.default_rng(0)
+    series = np.round(np.cumsum(rng.normal(0, 0.05, (200, 60)), axis=1), 4)
+    new = running_positive_sum(series)
+    for k, row in enumerate(series.tolist()):
+        assert new[k].tolist() == old_hourly_snow(row)
+        assert [round(v, 3) for v in new[k].tolist()] == old_positive_accum(row)
+
+
+def test_running_positive_sum_nan():
+    series = [0.0, 0.5, math.nan, 0.7, 1.0, 0.9]
+    new = running_positive_sum(series)[0].tolist()
+    # the accumulation loop treated a missing step as no increase, and so does derive
+    assert [round(v, 3) for v in new] == old_positive_accum(series)
+    # the rate loop let NaN poison the total until the next drop (and wrote NaN
+    # into the JSON); derive resets instead, like the accumulation loop
+    assert math.isnan(old_hourly_snow(series)[2])
+    assert new == [0.0, 0.5, 0.0, 0.0, 0.30000000000000004, 0.0]
+
+
+def test_running_positive_sum_is_per_station():
+    rows = [SERIES["drops"], SERIES["rising"][:1] * len(SERIES["drops"])]
+    new = running_positive_sum(rows)
+    assert new.shape == (2, len(SERIES["drops"]))
+    for k, row in enumerate(rows):
+        assert new[k].tolist() == old_hourly_snow(row)
+
+
+PRECIP_CASES = [
+    (0.0, 0.0),
+    (1e-5, 0.0),
+    (1e-5, 1.0),
+    (0.0, 1.0),
+    (-1e-6, 0.0),
+    (0.0, -1.0),
+    (math.nan, 0.0),
+    (1e-5, math.nan),
+    (math.nan, math.nan),
+    (math.nan, 1.0),
+]
+
+
+@pytest.mark.parametrize("prate,csnow", PRECIP_CASES)
+def test_precip_types_match_loop(prate, csnow):
+    assert str(precip_types(prate, csnow)[0, 0]) == old_classify_precip(prate, csnow)
+
+
+def test_precip_codes_series():
+    prates = [p for p, _ in PRECIP_CASES]
+    csnows = [c for _, c in PRECIP_CASES]
+    assert precip_types(prates, csnows)[0].tolist() == [old_classify_precip(p, c) for p, c in PRECIP_CASES]
+    assert precip_codes(prates, csnows).shape == (1, len(PRECIP_CASES))
+
+
+def test_precip_codes_empty():
+    assert precip_codes([], []).shape == (1, 0)
+    assert precip_types([], [])[0].tolist() == []
@@ -0,0 +1,153 @@
+import os
+import time
+
+import pytest
+
+import gfs_fetch
+from gfs_fetch import Downloader, RateLimiter, backoff_delay, build_filter_url
+from synthetic_gfs import StubServer, SyntheticGFS
+
+BBOX = (45.0, 44.0, 285.5, 286.5)
+
+
+# ------------------------
+# FIXTURES
+# ------------------------
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    # retries wait milliseconds instead of seconds
+    monkeypatch.setattr(gfs_fetch, "BACKOFF_BASE", 0.01)
+
+
+@pytest.fixture(scope="module")
+def source(tmp_path_factory):
+    return SyntheticGFS(str(tmp_path_factory.mktemp("synthetic")))
+
+
+@pytest.fixture(scope="module")
+def server(source):
+    server = StubServer(source).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def stub(server, monkeypatch):
+    server.faults, server.faults_served = [], 0
+    monkeypatch.setattr(gfs_fetch, "BASE_URL", server.filter_url)
+    return server
+
+
+def step_url(step=6):
+    return build_filter_url("20260101", "00", step, ["TMP"], ["975_mb"], BBOX)
+
+
+def fetch(tmp_path, **kwargs):
+    downloader = Downloader(max_workers=2, **kwargs)
+    try:
+        return downloader.fetch(step_url(), str(tmp_path / "f006.grib2"), 6)
+    finally:
+        downloader.close()
+
+
+def leftovers(tmp_path):
+    return sorted(os.listdir(tmp_path))
+
+
+# ------------------------
+# DOWNLOADER
+# ------------------------
+def test_fetch_writes_grib(stub, tmp_path):
+    path = fetch(tmp_path)
+    assert path == str(tmp_path / "f006.grib2")
+    assert gfs_fetch.is_grib(path)
+    assert leftovers(tmp_path) == ["f006.grib2"]
+
+
+def test_fetch_retries_server_errors(stub, tmp_path):
+    stub.faults = [503, 502, 429]
+    assert fetch(tmp_path, max_retries=3) is not None
+    assert stub.faults_served == 3 and stub.faults == []
+
+
+def test_fetch_gives_up_after_max_retries(stub, tmp_path):
+    stub.faults = [503] * 3
+    assert fetch(tmp_path, max_retries=2) is None
+    assert stub.faults_served == 3
+    assert leftovers(tmp_path) == []
+
+
+def test_fetch_does_not_retry_other_status(stub, tmp_path):
+    stub.faults = [404, 503]
+    assert fetch(tmp_path, max_retries=3) is None
+    assert stub.faults == [503]
+
+
+def test_fetch_honours_retry_after(stub, tmp_path):
+    stub.faults = [(503, "0.5")]
+    t0 = time.monotonic()
+    assert fetch(tmp_path, max_retries=1) is not None
+    assert time.monotonic() - t0 >= 0.5
+
+
+def test_truncated_body_is_retried(stub, tmp_path):
+    stub.faults = ["truncate"]
+    path = fetch(tmp_path, max_retries=1)
+    assert path is not None and gfs_fetch.is_grib(path)
+    assert leftovers(tmp_path) == ["f006.grib2"]
+
+
+def test_truncated_body_leaves_no_part_file(stub, tmp_path):
+    stub.faults = ["truncate"] * 2
+    assert fetch(tmp_path, max_retries=1) is None
+    assert leftovers(tmp_path) == []
+
+
+def test_fetch_all_spaces_requests_per_host(stub, tmp_path):
+    downloader = Downloader(max_workers=4, rate_limits={"127.0.0.1": 10})
+    jobs = [(step, step_url(step), str(tmp_path / f"f{step:03d}.grib2")) for step in (0, 3, 6, 9, 12)]
+    try:
+        t0 = time.monotonic()
+        paths = downloader.fetch_all(jobs)
+        elapsed = time.monotonic() - t0
+    finally:
+        downloader.close()
+    assert all(paths.values())
+    # five request starts at most 10/s apart: at least 0.4 s for the last one
+    assert elapsed >= 0.4
+
+
+# ------------------------
+# BACKOFF / RATE LIMITER
+# ------------------------
+def test_backoff_delay_uses_retry_after():
+    assert backoff_delay(0, "3") == 3.0
+    assert backoff_delay(0, "3600") == gfs_fetch.BACKOFF_MAX
+
+
+def test_backoff_delay_doubles_with_jitter():
+    for attempt in range(4):
+        delay = backoff_delay(attempt, "Wed, 21 Oct 2015 07:28:00 GMT")  # date form is ignored
+        full = gfs_fetch.BACKOFF_BASE * 2 ** attempt
+        assert full / 2 <= delay <= full
+
+
+def test_backoff_delay_is_capped(monkeypatch):
+    monkeypatch.setattr(gfs_fetch, "BACKOFF_BASE", 10.0)
+    assert backoff_delay(10) <= gfs_fetch.BACKOFF_MAX
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = RateLimiter(20)
+    t0 = time.monotonic()
+    for _ in range(5):
+        limiter.wait()
+    assert time.monotonic() - t0 >= 0.2
+
+
+def test_rate_limiter_unlimited():
+    limiter = RateLimiter(None)
+    t0 = time.monotonic()
+    for _ in range(100):
+        limiter.wait()
+    assert time.monotonic() - t0 < 0.1
@@ -0,0 +1,173 @@
+import os
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import publish
+import pipeline
+from publish import (Snapshot, current_snapshot, is_partial, list_snapshots, prune_snapshots,
+                     published_cycle, rollback, write_json_atomic)
+from stations import PRIMARY_STATION, station_json_path
+
+
+# ------------------------
+# FIXTURES
+# ------------------------
+@pytest.fixture(autouse=True)
+def snapshot_dir(tmp_path, monkeypatch):
+    root = tmp_path / "snapshots"
+    monkeypatch.setattr(publish, "SNAPSHOT_DIR", str(root))
+    monkeypatch.setattr(publish, "CURRENT_LINK", str(root / "current"))
+    return root
+
+
+def commit(cycle, files=None, partial=False):
+    """Publish a snapshot of `cycle` holding {name: data}; returns its name."""
+    snapshot = Snapshot(cycle, partial=partial)
+    for name, data in (files or {}).items():
+        write_json_atomic(os.path.join(snapshot.path, name), data)
+    snapshot.commit()
+    return snapshot.name
+
+
+def read_current(name):
+    with open(os.path.join(publish.CURRENT_LINK, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def live_product_cycles():
+    with open(station_json_path(PRIMARY_STATION, "run_meta.json", publish.CURRENT_LINK), "r",
+              encoding="utf-8") as f:
+        return json.load(f)["product_cycles"]
+
+
+# ------------------------
+# SNAPSHOTS
+# ------------------------
+def test_write_json_atomic_leaves_no_temp_file(tmp_path):
+    path = tmp_path / "out" / "data.json"
+    write_json_atomic(str(path), {"a": 1})
+    assert json.loads(path.read_text()) == {"a": 1}
+    assert os.listdir(path.parent) == ["data.json"]
+
+
+def test_nothing_published_yet():
+    assert current_snapshot() is None and published_cycle() is None
+    assert list_snapshots() == []
+
+
+def test_commit_makes_snapshot_current():
+    name = commit("2026101600", {"snow.json": [1]})
+    assert current_snapshot() == name and published_cycle() == "2026101600"
+    assert list_snapshots() == [name]
+    assert read_current("snow.json") == [1]
+
+
+def test_new_snapshot_is_seeded_from_current(snapshot_dir):
+    first = commit("2026101600", {"snow.json": [1], "temp.json": [2]})
+    second = commit("2026101606", {"snow.json": [3]})
+    assert read_current("snow.json") == [3]
+    # untouched files are carried over as hard links, rewritten ones are new files
+    assert read_current("temp.json") == [2]
+    assert os.path.samefile(snapshot_dir / first / "temp.json", snapshot_dir / second / "temp.json")
+    with open(snapshot_dir / first / "snow.json", "r", encoding="utf-8") as f:
+        assert json.load(f) == [1]
+
+
+def test_discard_keeps_current(snapshot_dir):
+    live = commit("2026101600", {"snow.json": [1]})
+    snapshot = Snapshot("2026101606")
+    write_json_atomic(os.path.join(snapshot.path, "snow.json"), [2])
+    snapshot.discard()
+    assert current_snapshot() == live and read_current("snow.json") == [1]
+    assert sorted(os.listdir(snapshot_dir)) == sorted(["current", live])
+
+
+def test_rollback_to_previous_snapshot():
+    first = commit("2026101600", {"snow.json": [1]})
+    commit("2026101606", {"snow.json": [2]})
+    assert rollback() == first
+    assert current_snapshot() == first and read_current("snow.json") == [1]
+    with pytest.raises(ValueError):
+        rollback()
+
+
+def test_rollback_to_named_snapshot():
+    first = commit("2026101600")
+    second = commit("2026101606")
+    commit("2026101612")
+    assert rollback(second) == second and published_cycle() == "2026101606"
+    assert rollback(first) == first
+    with pytest.raises(ValueError):
+        rollback("2026101618_missing")
+    assert current_snapshot() == first
+
+
+def test_prune_keeps_newest_and_current():
+    names = [commit(f"202610160{h}") for h in range(5)]
+    rollback(names[0])
+    prune_snapshots(keep=2)
+    assert list_snapshots() == [names[0]] + names[-2:]
+
+
+def test_partial_snapshot_superseded_within_its_cycle():
+    earlier = commit("2026101518")
+    first = commit("2026101600", partial=True)
+    second = commit("2026101600", partial=True)
+    assert is_partial(first) and list_snapshots() == [earlier, second]
+    final = commit("2026101600")
+    assert not is_partial(final)
+    assert list_snapshots() == [earlier, final]
+
+
+def test_partial_snapshot_of_another_cycle_is_kept():
+    partial = commit("2026101600", partial=True)
+    final = commit("2026101606")
+    assert list_snapshots() == [partial, final]
+
+
+# ------------------------
+# PIPELINE PUBLISH
+# ------------------------
+def product(name, fail=False):
+    """A stand-in product module that writes `{name}.json` for every station."""
+    def build(steps, values, station=PRIMARY_STATION, out_dir=None):
+        if fail:
+            raise RuntimeError(f"{name} failed")
+        write_json_atomic(station_json_path(station, f"{name}.json", out_dir), {"steps": list(steps)})
+    return SimpleNamespace(PRODUCT=name, build=build)
+
+
+def publish_cycle(hour_str, *failing):
+    modules = {name: product(name, name in failing) for name in ("snow", "temp")}
+    return pipeline.publish_snapshot("20261016", hour_str, modules, [0, 1], {}, [PRIMARY_STATION], True)
+
+
+def test_publish_snapshot_records_product_cycles():
+    assert publish_cycle("00") == []
+    assert published_cycle() == "2026101600"
+    assert live_product_cycles() == {"snow": "2026101600", "temp": "2026101600"}
+
+
+def test_failed_product_keeps_same_cycle_file():
+    publish_cycle("00")
+    live = current_snapshot()
+    assert publish_cycle("00", "temp") == ["temp"]
+    assert current_snapshot() != live
+    assert live_product_cycles() == {"snow": "2026101600", "temp": "2026101600"}
+
+
+def test_snapshot_mixing_cycles_is_discarded():
+    publish_cycle("00")
+    live = current_snapshot()
+    assert publish_cycle("06", "temp") == ["temp"]
+    assert current_snapshot() == live and published_cycle() == "2026101600"
+    assert list_snapshots() == [live]
+
+
+def test_snapshot_with_every_product_failed_is_discarded():
+    publish_cycle("00")
+    live = current_snapshot()
+    assert sorted(publish_cycle("06", "snow", "temp")) == ["snow", "temp"]
+    assert current_snapshot() == live
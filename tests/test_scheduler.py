@@ -0,0 +1,197 @@
+import json
+
+import pytest
+from filelock import FileLock
+
+import publish
+import runs
+import scheduler
+from publish import Snapshot
+from scheduler import Scheduler
+
+CYCLE = "2026101600"
+
+
+# ------------------------
+# FIXTURES
+# ------------------------
+@pytest.fixture
+def sched(tmp_path, monkeypatch):
+    """A Scheduler on a queue, run log and snapshot tree under tmp_path; its runs are recorded, not executed."""
+    queue_dir = tmp_path / "scheduler"
+    queue_dir.mkdir()
+    monkeypatch.setattr(scheduler, "SCHEDULER_DIR", str(queue_dir))
+    monkeypatch.setattr(scheduler, "RUN_LOCK_PATH", str(queue_dir / "run.lock"))
+    monkeypatch.setattr(scheduler, "QUEUE_LOCK_PATH", str(queue_dir / "queue.lock"))
+    monkeypatch.setattr(scheduler, "QUEUE_PATH", str(queue_dir / "queue.json"))
+    monkeypatch.setattr(runs, "CURRENT_PATH", str(tmp_path / "runs" / "current.json"))
+    monkeypatch.setattr(runs, "HISTORY_PATH", str(tmp_path / "runs" / "history.json"))
+    monkeypatch.setattr(scheduler, "RUNLOG", runs.RunLog())
+    monkeypatch.setattr(publish, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    monkeypatch.setattr(publish, "CURRENT_LINK", str(tmp_path / "snapshots" / "current"))
+    monkeypatch.setattr(scheduler, "expected_cycle", lambda now=None: CYCLE)
+
+    calls = []
+
+    def run_fn(products, force):
+        calls.append((products, force))
+        return []
+
+    s = Scheduler(run_fn=run_fn, auto=False)
+    s.calls = calls
+    return s
+
+
+def queued(s):
+    return {job["product"]: job for job in s.status()["jobs"]}
+
+
+def publish_cycle(cycle, partial=False):
+    Snapshot(cycle, partial=partial).commit()
+
+
+# ------------------------
+# QUEUE
+# ------------------------
+def test_request_queues_each_product(sched):
+    job_id, added, merged = sched.request(["snow_rate", "snow_acc"])
+    assert added == ["snow_rate", "snow_acc"] and merged == []
+    jobs = queued(sched)
+    assert sorted(jobs) == ["snow_acc", "snow_rate"]
+    assert all(job["job_ids"] == [job_id] and not job["force"] for job in jobs.values())
+
+
+def test_request_defaults_to_every_product(sched):
+    _, added, _ = sched.request()
+    assert added == scheduler.SCHEDULED_PRODUCTS
+
+
+def test_request_rejects_unknown_products(sched):
+    with pytest.raises(ValueError):
+        sched.request(["snow_rate", "wind"])
+    assert sched.status()["jobs"] == []
+
+
+def test_repeat_request_merges_into_waiting_entry(sched):
+    first, _, _ = sched.request(["snow_rate"], source="manual")
+    second, added, merged = sched.request(["snow_rate", "temp_975"], source="api", force=True)
+    assert added == ["temp_975"] and merged == ["snow_rate"]
+    jobs = queued(sched)
+    assert len(sched.status()["jobs"]) == 2
+    assert jobs["snow_rate"]["job_ids"] == [first, second]
+    assert jobs["snow_rate"]["sources"] == ["manual", "api"]
+    assert jobs["snow_rate"]["force"]
+
+
+def test_merge_keeps_force(sched):
+    sched.request(["snow_acc"], force=True)
+    sched.request(["snow_acc"], force=False)
+    assert queued(sched)["snow_acc"]["force"]
+
+
+def test_job_reports_queued_products(sched):
+    job_id, _, _ = sched.request(["precip_type", "snow_acc"])
+    job = sched.job(job_id)
+    assert job["state"] == "queued"
+    assert sorted(job["products"]) == ["precip_type", "snow_acc"]
+    assert sched.job("no-such-job") is None
+
+
+# ------------------------
+# DRAIN
+# ------------------------
+def test_drain_runs_waiting_jobs_as_one_batch(sched):
+    first, _, _ = sched.request(["snow_rate"])
+    second, _, _ = sched.request(["snow_acc"], force=True)
+    assert sched.drain()
+    assert sched.calls == [(["snow_rate", "snow_acc"], True)]
+    state = sched.status()
+    assert state["jobs"] == [] and state["running"] == []
+    assert "run_id" not in state and state["last_run_id"]
+    for job_id in (first, second):
+        job = sched.job(job_id)
+        assert job["state"] == "success"
+        assert job["run"]["id"] == state["last_run_id"]
+
+
+def test_drain_with_empty_queue_runs_nothing(sched):
+    assert sched.drain()
+    assert sched.calls == []
+
+
+def test_drain_records_pipeline_failure(sched):
+    def broken(products, force):
+        raise RuntimeError("NOMADS down")
+
+    sched.run_fn = broken
+    job_id, _, _ = sched.request(["temp_975"])
+    assert sched.drain()
+    job = sched.job(job_id)
+    assert job["state"] == "error"
+    assert "NOMADS down" in job["run"]["error"]
+    assert sched.status()["running"] == []
+
+
+def test_drain_requeues_interrupted_batch(sched):
+    job_id, _, _ = sched.request(["snow_rate"])
+    # a batch left marked running by a process that died mid-run
+    state = sched.status()
+    state["running"] = [dict(state["jobs"][0], product="precip_type", job_ids=["lost"])]
+    with open(scheduler.QUEUE_PATH, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    assert sched.drain()
+    assert [sorted(products) for products, _ in sched.calls] == [["precip_type", "snow_rate"]]
+    assert sched.job("lost")["state"] == "success"
+
+
+def test_drain_skips_while_another_process_runs(sched):
+    sched.request(["snow_rate"])
+    other = FileLock(scheduler.RUN_LOCK_PATH)
+    with other.acquire(timeout=0):
+        assert not sched.drain()
+    assert sched.calls == []
+    assert list(queued(sched)) == ["snow_rate"]
+
+
+# ------------------------
+# AUTO SCHEDULE
+# ------------------------
+def test_auto_enqueue_queues_every_product_for_due_cycle(sched):
+    sched._auto_enqueue()
+    jobs = queued(sched)
+    assert sorted(jobs) == sorted(scheduler.SCHEDULED_PRODUCTS)
+    assert all(job["job_ids"] == [f"auto-{CYCLE}"] for job in jobs.values())
+    assert sched.status()["auto"]["cycle"] == CYCLE
+
+
+def test_auto_enqueue_waits_between_retries(sched):
+    sched._auto_enqueue()
+    sched.drain()
+    sched._auto_enqueue()
+    assert sched.status()["jobs"] == []
+
+
+def test_auto_enqueue_retries_after_retry_seconds(sched, monkeypatch):
+    sched._auto_enqueue()
+    sched.drain()
+    monkeypatch.setattr(scheduler, "RETRY_SECONDS", 0)
+    sched._auto_enqueue()
+    assert sorted(queued(sched)) == sorted(scheduler.SCHEDULED_PRODUCTS)
+
+
+def test_auto_enqueue_skips_published_cycle(sched):
+    publish_cycle(CYCLE)
+    sched._auto_enqueue()
+    assert sched.status()["jobs"] == []
+
+
+def test_auto_enqueue_retries_partial_cycle(sched):
+    publish_cycle(CYCLE, partial=True)
+    sched._auto_enqueue()
+    assert sorted(queued(sched)) == sorted(scheduler.SCHEDULED_PRODUCTS)
+
+
+def test_auto_enqueue_queues_when_live_cycle_is_older(sched):
+    publish_cycle("2026101518")
+    sched._auto_enqueue()
+    assert sorted(queued(sched)) == sorted(scheduler.SCHEDULED_PRODUCTS)